@@ -0,0 +1,276 @@
+import gc
+from shapes import Polygon, Shape, maxchop, minchop
+from vector import Vector3
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+"""
+	Batch version of Polygon.subdivide(), all faces are subdivided at once level by level,
+	each level splits every polygon that still needs it with numpy, instead of clipping polygons one by one.
+	It follows the same maxchop/minchop rules and does the same floating point operations in the same order
+	as Polygon does, so the produced patches are exactly the same, and they are returned in the same order
+	as the recursive subdivision produces them.
+"""
+
+# Same epsilon and limits as used by Polygon.subdivide() and Polygon.clip_epsilon()
+clip_epsilon = 0.1
+max_points = 64
+max_depth = 62
+
+
+def available():
+	return np is not None
+
+
+def area_and_center(points, counts):
+	""" Vectorized Polygon.calc_area_and_center() """
+	total = np.zeros(len(points))
+	center = np.zeros((len(points), 3))
+	p0 = points[:, 0]
+
+	for i in range(1, points.shape[1] - 1):
+		valid = i + 1 < counts
+		p1 = points[:, i]
+		p2 = points[:, i + 1]
+
+		a = p1 - p0
+		b = p2 - p1
+		x = a[:, 1] * b[:, 2] - b[:, 1] * a[:, 2]
+		y = a[:, 2] * b[:, 0] - b[:, 2] * a[:, 0]
+		z = a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]
+
+		area = np.sqrt(x * x + y * y + z * z)
+		third = (area / 3)[:, None]
+		total = np.where(valid, total + area, total)
+		center = np.where(valid[:, None], center + p1 * third + p2 * third + p0 * third, center)
+
+	with np.errstate(divide = "ignore", invalid = "ignore"):
+		center = np.where((total != 0)[:, None], center * (1 / total)[:, None], center)
+
+	return total * 0.5, center
+
+
+def bounds(points, counts):
+	valid = (np.arange(points.shape[1]) < counts[:, None])[:, :, None]
+	return np.where(valid, points, np.inf).min(axis = 1), np.where(valid, points, -np.inf).max(axis = 1)
+
+
+def normals(points, counts):
+	""" Vectorized Polygon.calc_normal() """
+	rows = np.arange(len(points))
+	norm = np.zeros((len(points), 3))
+
+	for i in range(points.shape[1]):
+		valid = (i < counts)[:, None]
+		p0 = points[:, i]
+		p1 = points[rows, np.where(i + 1 < counts, i + 1, 0)]
+		term = np.stack([
+			(p0[:, 1] - p1[:, 1]) * (p0[:, 2] + p1[:, 2]),
+			(p0[:, 2] - p1[:, 2]) * (p0[:, 0] + p1[:, 0]),
+			(p0[:, 0] - p1[:, 0]) * (p0[:, 1] + p1[:, 1])
+		], axis = 1)
+		norm = np.where(valid, norm + term, norm)
+
+	length = np.sqrt(norm[:, 0] * norm[:, 0] + norm[:, 1] * norm[:, 1] + norm[:, 2] * norm[:, 2])
+	with np.errstate(divide = "ignore", invalid = "ignore"):
+		norm = np.where((length != 0)[:, None], norm / length[:, None], 0.0)
+
+	# Same as Vector3.__neg__(), zeroes keep their sign
+	return np.where(norm != 0, -norm, norm)
+
+
+def pack(emitted, mask):
+	""" Gathers emitted points of every polygon into a padded array, keeping their order """
+	counts = mask.sum(axis = 1)
+	packed = np.zeros((len(mask), max(counts.max(initial = 0), 3), 3))
+	rows, cols = np.nonzero(mask)
+	packed[rows, (np.cumsum(mask, axis = 1) - 1)[rows, cols]] = emitted[rows, cols]
+	return packed, counts
+
+
+def clip(points, counts, axis, dist):
+	""" Vectorized Polygon.clip_epsilon() for an axis aligned unit normal, returns front and back polygons, their counts and the failed ones """
+	rows = np.arange(len(points))
+	width = points.shape[1]
+	valid = np.arange(width) < counts[:, None]
+
+	coords = points[rows[:, None], np.arange(width)[None, :], axis[:, None]]
+	dists = coords - dist[:, None]
+	sides = np.where(dists > clip_epsilon, 0, np.where(dists < -clip_epsilon, 1, 2))
+	sides = np.where(valid, sides, 3)
+
+	# One of the sides being empty means the polygon is returned as is, which leads to an endless recursion
+	failed = ((sides == 0).sum(axis = 1) == 0) | ((sides == 1).sum(axis = 1) == 0) | (counts >= 68)
+
+	following = np.where(np.arange(width)[None, :] + 1 < counts[:, None], np.arange(width)[None, :] + 1, 0)
+	sides_next = np.take_along_axis(sides, following, axis = 1)
+	dists_next = np.take_along_axis(dists, following, axis = 1)
+	points_next = points[rows[:, None], following]
+
+	crossing = valid & (sides != 2) & (sides_next != 2) & (sides_next != sides)
+	# Only the mids of the crossing edges are used, the rest might be nan
+	with np.errstate(divide = "ignore", invalid = "ignore"):
+		dot = dists / (dists - dists_next)
+		mids = points + dot[:, :, None] * (points_next - points)
+	mids[rows[:, None], np.arange(width)[None, :], axis[:, None]] = dist[:, None]
+
+	emitted = np.stack([points, mids], axis = 2).reshape(len(points), width * 2, 3)
+	front = np.stack([valid & (sides != 1), crossing], axis = 2).reshape(len(points), width * 2)
+	back = np.stack([valid & (sides != 0), crossing], axis = 2).reshape(len(points), width * 2)
+
+	front, front_counts = pack(emitted, front)
+	back, back_counts = pack(emitted, back)
+
+	failed = failed | (front_counts > np.minimum(counts + 4, max_points)) | (back_counts > np.minimum(counts + 4, max_points))
+	failed = failed | ((front_counts < 3) & (back_counts < 3))
+
+	return front, front_counts, back, back_counts, failed
+
+
+def subdivide_faces(faces, luxscales):
+	""" Same as Shape.subdivide_poly_to_shape() for every face with its luxel scale, returns a shape or an exception for each """
+	assert np is not None, "numpy is required for the batch subdivision!"
+
+	width = max([len(x) for x in faces] + [3])
+	points = np.zeros((len(faces), width, 3))
+	counts = np.zeros(len(faces), dtype = np.int64)
+	for i, face in enumerate(faces):
+		points[i, :len(face)] = [(p.x, p.y, p.z) for p in face]
+		counts[i] = len(face)
+
+	return subdivide_points(points, counts, luxscales)
+
+
+def gather_faces(faceindices, faces, surfedges, edges, verts):
+	""" Returns padded points of the faces read from the lump arrays and their counts, for subdivide_points() """
+	assert np is not None, "numpy is required for the batch subdivision!"
+
+	face = faces.array[np.asarray(faceindices, dtype = np.int64)]
+	counts = face["numedges"].astype(np.int64)
+	width = max(counts.max(initial = 0), 3)
+
+	rows, cols = np.nonzero(np.arange(width) < counts[:, None])
+	surfedge = surfedges.array[face["firstedge"][rows].astype(np.int64) + cols]
+	v = edges.array["v"][np.abs(surfedge)]
+
+	points = np.zeros((len(face), width, 3))
+	points[rows, cols] = verts.array["point"][np.where(surfedge < 0, v[:, 1], v[:, 0])]
+	return points, np.maximum(counts, 0)
+
+
+def subdivide_points(points, counts, luxscales):
+	""" Same as subdivide_faces(), but the points of the faces are already padded into an array """
+	results = [None] * len(points)
+	for i in np.nonzero(counts < 3)[0].tolist():
+		results[i] = AssertionError(f"Wrong polygon being constructed. ({counts[i]} < 3)")
+
+	# Points of such faces are never used, same as they wouldn't be set at all
+	counts = np.where(counts < 3, 0, counts)
+	alive = np.ones(len(points), dtype = bool)
+
+	owners = np.arange(len(results))
+	luxscale = np.array(luxscales, dtype = np.float64)
+	paths = np.zeros(len(results), dtype = np.int64)
+	depths = np.zeros(len(results), dtype = np.int64)
+	# Patches share the normal of their face, same as with Polygon.subdivide()
+	facenormals = normals(points, counts)
+
+	leaves = []
+	level = 0
+
+	while len(owners) > 0:
+		# Polygons of the faces that have failed are dropped as soon as possible
+		alive[[i for i, x in enumerate(results) if x is not None]] = False
+		keep = alive[owners]
+		owners, points, counts, paths, depths = owners[keep], points[keep], counts[keep], paths[keep], depths[keep]
+		if len(owners) == 0:
+			break
+
+		mins, maxs = bounds(points, counts)
+		total = (maxs - mins) * luxscale[owners][:, None]
+		widest = np.argmax(total, axis = 1)
+
+		subdiv = np.any((total >= maxchop) & (total >= minchop), axis = 1)
+		if maxchop > minchop:
+			rows = np.arange(len(total))
+			widest_total = total[rows, widest]
+			subdiv = subdiv | ((widest_total > total[rows, (widest + 1) % 3] * 2) & (widest_total > total[rows, (widest + 2) % 3] * 2))
+
+		# Same as Polygon.subdivide(), only the patches are checked for having an area
+		done = ~subdiv
+		areas, centers = area_and_center(points[done], counts[done])
+		for i in np.unique(owners[done][~(areas > 0)]):
+			if results[i] is None:
+				results[i] = AssertionError("Zero area child patch!!!!")
+		leaves.append((owners[done], points[done], counts[done], paths[done], depths[done], mins[done], maxs[done], areas, centers))
+
+		split = np.nonzero(subdiv)[0]
+		if len(split) == 0:
+			break
+
+		dist = (mins[split, widest[split]] + maxs[split, widest[split]]) * 0.5
+		front, front_counts, back, back_counts, clip_failed = clip(points[split], counts[split], widest[split], dist)
+
+		for i in np.unique(owners[split][clip_failed]):
+			results[i] = AssertionError("Subdivision of the face doesn't converge or exceeds maximum points of a polygon!")
+		if level + 1 > max_depth:
+			for i in np.unique(owners[split]):
+				results[i] = AssertionError("Subdivision of the face exceeds maximum depth!")
+
+		keep_front = front_counts >= 3
+		keep_back = back_counts >= 3
+		newwidth = max(front.shape[1], back.shape[1])
+		front = np.pad(front, ((0, 0), (0, newwidth - front.shape[1]), (0, 0)))
+		back = np.pad(back, ((0, 0), (0, newwidth - back.shape[1]), (0, 0)))
+
+		owners = np.concatenate([owners[split][keep_front], owners[split][keep_back]])
+		points = np.concatenate([front[keep_front], back[keep_back]])
+		counts = np.concatenate([front_counts[keep_front], back_counts[keep_back]])
+		paths = np.concatenate([paths[split][keep_front] * 2, paths[split][keep_back] * 2 + 1])
+		depths = np.concatenate([depths[split][keep_front], depths[split][keep_back]]) + 1
+		level = level + 1
+
+	# Patches are ordered the same way the recursive subdivision visits them, front pieces first.
+	# None of the created objects reference each other in cycles, so garbage collection
+	# is paused while they are created, it would just rescan all of them over and over
+	collect = gc.isenabled()
+	gc.disable()
+
+	try:
+		patches = build_patches(results, leaves, facenormals)
+	finally:
+		if collect:
+			gc.enable()
+
+	for i in range(len(results)):
+		if results[i] is None:
+			results[i] = Shape([poly for key, poly in sorted(patches[i], key = lambda x: x[0])])
+
+	return results
+
+
+def build_patches(results, leaves, facenormals):
+	patches = [[] for x in results]
+	for owners, points, counts, paths, depths, mins, maxs, areas, centers in leaves:
+		norms = facenormals[owners].tolist()
+		keys = (paths << (max_depth - depths)).tolist()
+		points, counts, mins, maxs, areas, centers = points.tolist(), counts.tolist(), mins.tolist(), maxs.tolist(), areas.tolist(), centers.tolist()
+
+		for i, owner in enumerate(owners.tolist()):
+			if results[owner] is not None:
+				continue
+
+			patches[owner].append((keys[i], Polygon.fromcomputed(
+				[Vector3(*x) for x in points[i][:counts[i]]],
+				Vector3(*norms[i]),
+				Vector3(*mins[i]),
+				Vector3(*maxs[i]),
+				areas[i],
+				Vector3(*centers[i])
+			)))
+
+	return patches
@@ -0,0 +1,281 @@
+import io
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import statistics
+import contextlib
+import subprocess
+from bsplib import *
+from shapes import Polygon, Shape
+from synthbsp import SyntheticBSP
+import batchsubdivide
+import lightsradextractor
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+
+"""
+	Benchmarks the stages of the extraction separately on a synthetic map: parsing (BSPFile.frombytes()),
+	subdivision (Shape.subdivide_poly_to_shape() and the numpy engine if it's available), matching of the lights
+	and writing of the .rad file. Results can be saved and compared against the ones saved before, so
+	regressions between commits are caught before the builds are rolled out.
+"""
+
+
+def measure(func, repeat):
+	""" Runs func repeat times, returns min and median of the wall times in seconds """
+	times = []
+	for i in range(repeat):
+		starttime = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - starttime)
+
+	return {"min": min(times), "median": statistics.median(times)}
+
+
+def run(data, repeat, search_distance):
+	results = dict()
+	bsp = BSPFile.frombytes(data)
+
+	results["frombytes"] = measure(lambda: BSPFile.frombytes(data), repeat)
+
+	edges = bsp.lumps[BSPLumps.LUMP_EDGES].data
+	surfedges = bsp.lumps[BSPLumps.LUMP_SURFEDGES].data
+	verts = bsp.lumps[BSPLumps.LUMP_VERTEXES].data
+	texinfo = bsp.lumps[BSPLumps.LUMP_TEXINFO].data
+	texdata = bsp.lumps[BSPLumps.LUMP_TEXDATA].data
+	faces = bsp.lumps[BSPLumps.LUMP_FACES].data
+	worldlights = bsp.lumps[BSPLumps.LUMP_WORLDLIGHTS].data
+	texnames = bsp.texture_names
+
+	lightfaces = lightsradextractor.collect_light_faces(faces, texinfo, texnames, edges, surfedges, verts, False)
+	shapes = []
+
+	def subdivide():
+		shapes.clear()
+		for faceidx, points, luxscale in lightfaces:
+			shapes.append((Shape.subdivide_poly_to_shape(Polygon(points), luxscale), faceidx))
+
+	results["subdivide"] = measure(subdivide, repeat)
+
+	if batchsubdivide.available():
+		results["subdivide_numpy"] = measure(lambda: batchsubdivide.subdivide_faces([x[1] for x in lightfaces], [x[2] for x in lightfaces]), repeat)
+
+	# Patch centers are calculated on the first access, done here so the matching doesn't pay for them only on its first run
+	for shape, faceidx in shapes:
+		for poly in shape.polys:
+			poly.center
+
+	foundtextures = dict()
+
+	def match():
+		foundtextures.clear()
+		foundtextures.update(lightsradextractor.match_lights(shapes, list(worldlights), faces, texinfo, texdata, texnames, search_distance))
+
+	results["match"] = measure(match, repeat)
+
+	with tempfile.TemporaryDirectory() as tmp:
+		path = os.path.join(tmp, "benchmark.bsp")
+		textures = {key: list(value[0]) for key, value in foundtextures.items()}
+
+		with contextlib.redirect_stdout(io.StringIO()):
+			results["write"] = measure(lambda: lightsradextractor.write_rad(path, textures), repeat)
+
+	return results, {"light_faces": len(lightfaces), "patches": sum([len(x[0].polys) for x in shapes]), "textures": len(foundtextures)}
+
+
+def original_match(shapes, lights, faces, texinfo, texdata, texnames, search_distance):
+	""" Matching loop of the original extraction, kept as is to check match_lights() against it """
+	foundtextures = dict()
+
+	for light in lights:
+		if light.type == EmitType.emit_surface:
+			for shape, faceidx in shapes:
+				face: dface_t = faces[faceidx]
+				tx: texinfo_t = texinfo[face.texinfo]
+				txdata: dtexdata_t = texdata[tx.texdata]
+				texture = texnames[tx.texdata]
+
+				if texture in foundtextures:
+					shapes.remove((shape, faceidx))
+					continue
+
+				poly: Polygon = shape.close_enough(light.origin, search_distance)
+
+				if poly is not None:
+					foundtextures[texture] = [lightsradextractor.light_color(light, tx, txdata, poly.area)]
+
+					lights.remove(light)
+					shapes.remove((shape, faceidx))
+
+					break
+
+	return foundtextures
+
+
+def check(data, search_distance):
+	""" Compares the found textures and the lights left unmatched by match_lights() and original_match(), returns the names of the ones that differ """
+	bsp = BSPFile.frombytes(data)
+
+	faces = bsp.lumps[BSPLumps.LUMP_FACES].data
+	texinfo = bsp.lumps[BSPLumps.LUMP_TEXINFO].data
+	texdata = bsp.lumps[BSPLumps.LUMP_TEXDATA].data
+	worldlights = bsp.lumps[BSPLumps.LUMP_WORLDLIGHTS].data
+	planes = bsp.lumps[BSPLumps.LUMP_PLANES].data
+	texnames = bsp.texture_names
+
+	lightfaces = lightsradextractor.collect_light_faces(faces, texinfo, texnames, bsp.lumps[BSPLumps.LUMP_EDGES].data, bsp.lumps[BSPLumps.LUMP_SURFEDGES].data, bsp.lumps[BSPLumps.LUMP_VERTEXES].data, False)
+	shapes = [(Shape.subdivide_poly_to_shape(Polygon(points), luxscale), faceidx) for faceidx, points, luxscale in lightfaces]
+
+	lights = list(worldlights)
+	expected = (original_match(list(shapes), lights, faces, texinfo, texdata, texnames, search_distance), lights)
+
+	differ = []
+	for name, kwargs in (("match", {}), ("match_planes", {"planes": planes})):
+		lights = list(worldlights)
+		foundtextures = lightsradextractor.match_lights(shapes, lights, faces, texinfo, texdata, texnames, search_distance, **kwargs)
+		if (list(foundtextures.items()), lights) != (list(expected[0].items()), expected[1]):
+			differ.append(name)
+
+	return differ
+
+
+def git_revision():
+	try:
+		return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, check = True).stdout.strip()
+	except Exception:
+		return None
+
+
+def compare(results, baseline, threshold):
+	""" Prints the change of every benchmark against the baseline, returns True if any is slower by more than threshold percents """
+	regressed = False
+
+	print(f"Compared to {baseline.get('revision') or 'unknown revision'}:")
+	for name, value in results.items():
+		if name not in baseline["results"]:
+			print(f"{name:>16}: {value['min'] * 1000:10.3f} ms (new)")
+			continue
+
+		old = baseline["results"][name]["min"]
+		change = (value["min"] - old) / old * 100 if old > 0 else 0
+		mark = ""
+		if change > threshold:
+			mark = " REGRESSION"
+			regressed = True
+
+		print(f"{name:>16}: {old * 1000:10.3f} ms -> {value['min'] * 1000:10.3f} ms ({change:+.1f}%){mark}")
+
+	return regressed
+
+
+def main(args):
+	settings = {
+		"bsp_version": args.bsp_version,
+		"faces": args.faces,
+		"light_faces": args.light_faces,
+		"worldlights": args.worldlights,
+		"textures": args.textures,
+		"vertices": args.vertices,
+		"strings": args.strings,
+		"panel_size": args.panel_size,
+		"seed": args.seed,
+		"search_distance": args.search_distance,
+		"repeat": args.repeat
+	}
+
+	print("Generating synthetic map:", ", ".join([f"{key} = {value}" for key, value in settings.items()]))
+	data = SyntheticBSP(args.bsp_version, args.faces, args.light_faces, args.worldlights, args.textures, args.vertices, args.strings, args.panel_size, seed = args.seed).build().tobytes()
+
+	if args.check:
+		differ = check(data, args.search_distance)
+		for name in differ:
+			print(f"{name:>16}: results differ from the original matching loop!")
+		if not differ:
+			print("Results are the same as the ones of the original matching loop")
+		return 1 if differ else 0
+
+	results, counts = run(data, args.repeat, args.search_distance)
+
+	print(f"{len(data)} bytes, {counts['light_faces']} light faces, {counts['patches']} patches, {counts['textures']} textures found")
+	for name, value in results.items():
+		print(f"{name:>16}: {value['min'] * 1000:10.3f} ms min, {value['median'] * 1000:10.3f} ms median")
+
+	report = {
+		"revision": git_revision(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"settings": settings,
+		"results": results
+	}
+
+	if args.output:
+		with open(args.output, "w") as out:
+			json.dump(report, out, indent = 4)
+		print(f"Results saved to {args.output}")
+
+	if args.compare:
+		with open(args.compare, "r") as inp:
+			baseline = json.load(inp)
+
+		if baseline["settings"] != settings:
+			print("Baseline was made with different settings, results aren't comparable!")
+			return 2
+
+		if compare(results, baseline, args.threshold):
+			return 1
+
+	return 0
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser(description = 'Benchmarks LightsRadExtractor stages on a synthetic map.', formatter_class = ArgumentDefaultsHelpFormatter)
+	parser.add_argument('--bsp_version',
+			help = 'Version of the generated map;',
+			action = 'store', type = int, choices = (20, 21), default = 21, dest = 'bsp_version')
+	parser.add_argument('--faces',
+			help = 'Total amount of faces;',
+			action = 'store', type = int, default = 10000, dest = 'faces')
+	parser.add_argument('--light_faces',
+			help = 'Amount of faces with a light texture;',
+			action = 'store', type = int, default = 1000, dest = 'light_faces')
+	parser.add_argument('--worldlights',
+			help = 'Amount of worldlights, surface lights for every light face first, point lights for the rest;',
+			action = 'store', type = int, default = 1500, dest = 'worldlights')
+	parser.add_argument('--textures',
+			help = 'Amount of light textures;',
+			action = 'store', type = int, default = 64, dest = 'textures')
+	parser.add_argument('--vertices',
+			help = 'Minimum amount of vertices, every face uses 4 of its own;',
+			action = 'store', type = int, default = 0, dest = 'vertices')
+	parser.add_argument('--strings',
+			help = 'Minimum amount of string table entries;',
+			action = 'store', type = int, default = 0, dest = 'strings')
+	parser.add_argument('--panel_size',
+			help = 'Size of the light faces in units, they are subdivided into (panel_size / 16) ^ 2 patches;',
+			action = 'store', type = int, default = 128, dest = 'panel_size')
+	parser.add_argument('--seed',
+			help = 'Seed for the placement of the lights;',
+			action = 'store', type = int, default = 0, dest = 'seed')
+	parser.add_argument('-d', '--distance',
+			help = 'Distance to search for the light in units;',
+			action = 'store', type = int, default = 1, dest = 'search_distance')
+	parser.add_argument('-r', '--repeat',
+			help = 'Amount of times every benchmark is run, the fastest run is compared;',
+			action = 'store', type = int, default = 5, dest = 'repeat')
+	parser.add_argument('-o', '--output',
+			help = 'Path to save the results to as json;',
+			action = 'store', default = None, dest = 'output')
+	parser.add_argument('-c', '--compare',
+			help = 'Path to the results saved before to compare against, exits with 1 if any of the benchmarks regressed;',
+			action = 'store', default = None, dest = 'compare')
+	parser.add_argument('-t', '--threshold',
+			help = 'Slowdown in percents past which a benchmark is considered to be regressed;',
+			action = 'store', type = float, default = 10, dest = 'threshold')
+	parser.add_argument('--check',
+			help = 'Instead of benchmarking, compares the results of the light matching with the original loop over all of the light faces, exits with 1 if they differ;',
+			action = 'store_true', default = False, dest = 'check')
+
+	sys.exit(main(parser.parse_args()))
@@ -1,7 +1,16 @@
 import enum
+import lzma
+import math
+import mmap
 import struct
+import sys
 import abc
-from vector import Vector
+from vector import Vector3
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
 
 
 class BSPLumps(enum.IntEnum):
@@ -102,6 +111,12 @@ class EmitType(enum.IntEnum):
 
 
 class ByteSection(abc.ABC):
+	# Fields of the structure in the same order as in the struct definition, each entry is
+	# (name, struct format character, count or shape), used to build numpy dtype and the compiled
+	# decoder of the structure. Float triples are decoded as Vector3, other multi-value fields as tuples,
+	# "x" entries are padding bytes and aren't decoded
+	layout = None
+
 	def __init__(self, data):
 		pass
 
@@ -124,6 +139,79 @@ class ByteSection(abc.ABC):
 	def iterate_all():
 		return True
 
+	@classmethod
+	def dtype(cls):
+		assert np is not None, "numpy is required to decode lumps as arrays!"
+		assert cls.layout is not None, f"{cls.__name__} struct has no layout defined, can't be decoded as an array!"
+
+		if cls not in dtypes:
+			names, formats, offsets = [], [], []
+			definition = ""
+
+			for name, fmt, shape in cls.layout:
+				count = shape if isinstance(shape, int) else math.prod(shape)
+				definition = definition + f"{count}{fmt}"
+				if fmt == "x":
+					continue
+
+				names.append(name)
+				formats.append(f"<{fmt}" if shape == 1 else (f"<{fmt}", shape))
+				# Native struct alignment, same as the one the struct has in the file
+				offsets.append(struct.calcsize(definition) - struct.calcsize(f"{count}{fmt}"))
+
+			dtypes[cls] = np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": cls.byte_size()})
+
+		return dtypes[cls]
+
+	@classmethod
+	def decoder(cls):
+		""" Compiles layout of the structure into a function that decodes the whole lump at once """
+		assert cls.layout is not None, f"{cls.__name__} struct has no layout defined, can't compile a decoder for it!"
+
+		if cls not in decoders:
+			definition = ""
+			fields = []
+			index = 0
+
+			for name, fmt, shape in cls.layout:
+				count = shape if isinstance(shape, int) else math.prod(shape)
+				definition = definition + f"{count}{fmt}"
+				if fmt == "x":
+					continue
+
+				values = [f"v{i}" for i in range(index, index + count)]
+				index = index + count
+
+				if shape == 1:
+					fields.append(f"record.{name} = {values[0]}")
+				elif shape == 3 and fmt == "f":
+					fields.append(f"record.{name} = Vector3({', '.join(values)})")
+				elif isinstance(shape, int):
+					fields.append(f"record.{name} = ({', '.join(values)})")
+				else:
+					rows = [f"({', '.join(values[i:i + shape[1]])})" for i in range(0, count, shape[1])]
+					fields.append(f"record.{name} = ({', '.join(rows)})")
+
+			layout = struct.Struct(definition)
+			assert layout.size == cls.byte_size(), f"Layout of {cls.__name__} struct doesn't match its size ({layout.size} != {cls.byte_size()})!"
+
+			code = "\n".join([
+				"def decode(bytedata):",
+				"\trecords = []",
+				"\tappend = records.append",
+				f"\tfor {', '.join(f'v{i}' for i in range(index))}, in iter_unpack(bytedata):",
+				"\t\trecord = new(cls)",
+				*[f"\t\t{x}" for x in fields],
+				"\t\tappend(record)",
+				"\treturn records"
+			])
+
+			namespace = {"cls": cls, "new": object.__new__, "iter_unpack": layout.iter_unpack, "Vector3": Vector3}
+			exec(code, namespace)
+			decoders[cls] = namespace["decode"]
+
+		return decoders[cls]
+
 	def __repr__(self):
 		return "<{0}: [\n\t{1}\n]>".format(
 			self.__class__.__name__,
@@ -131,6 +219,13 @@ class ByteSection(abc.ABC):
 		)
 
 
+dtypes = {}
+decoders = {}
+
+# Header of the LZMA compressed lumps: "LZMA" id, actual (uncompressed) size, lzma data size and lzma properties
+lzma_header = struct.Struct("<4sII5s")
+
+
 class BSPFile(ByteSection):
 	def __init__(self, data):
 		super().__init__(data)
@@ -139,9 +234,37 @@ class BSPFile(ByteSection):
 		self.version = data[2]
 		self.lumps = data[3]
 		self.map_revision = data[4]
+		self.__texture_names = None
 
 	@classmethod
 	def frombytes(cls, bytedata):
+		bsp = cls.fromheader(bytedata)
+
+		for lump in bsp.lumps:
+			if lump.mapping is not None and not lump.estimated:
+				lump.data
+
+		# Lumps with an estimated size are decoded last, as their size depends on other lumps
+		for lump in bsp.lumps:
+			if lump.estimated:
+				lump.data
+
+		return bsp
+
+	@classmethod
+	def open(cls, path):
+		""" Maps .bsp file into memory and parses only its header, lumps are decoded on first access """
+		with open(path, "rb") as inp:
+			buffer = mmap.mmap(inp.fileno(), 0, access = mmap.ACCESS_READ)
+
+		try:
+			return cls.fromheader(buffer)
+		except:
+			buffer.close()
+			raise
+
+	@classmethod
+	def fromheader(cls, bytedata):
 		assert len(bytedata) >= cls.byte_size(), f"Wrong sized bytedata passed to {cls.__name__} struct! ({len(bytedata)} < {cls.byte_size()})"
 		data = struct.unpack("2I", bytedata[0:8])
 
@@ -149,64 +272,59 @@ class BSPFile(ByteSection):
 		assert data[0] == 0x50534256, "Not a bsp file were specified!"
 
 		lumps = []
-		unresolved_lumps = []
 
 		for i in range(BSPLumps.HEADER_LUMPS):
 			lump = lump_t.frombytes(bytedata[(i * 16) + 8:((i + 1) * 16) + 8])
+			lump.index = BSPLumps(i)
+			lump.file = bytedata
+			lump.compressed = lump.filelen >= lzma_header.size and bytedata[lump.fileofs:lump.fileofs + 4] == b"LZMA"
+			lump.mapping = lumps_mapping.get(BSPLumps(i))
 			lumps.append(lump)
 
-			if i in lumps_mapping:
-				if lump.filelen > 0:
-					if type(lumps_mapping[BSPLumps(i)]) == dict:
-						assert lump.version in lumps_mapping[BSPLumps(i)], f"Invalid or unsupported lump version {lump.version} for {str(BSPLumps(i))}."
-						ctype = lumps_mapping[BSPLumps(i)][lump.version]
-					else:
-						ctype = lumps_mapping[BSPLumps(i)]
-
-					if ctype.iterate_all():
-						assert lump.filelen % ctype.byte_size() == 0, f"Failed to parse {str(BSPLumps(i))}, bogus section size ({lump.filelen} % {ctype.byte_size()})."
-						lump.data = []
-
-						for j in range(0, lump.filelen, ctype.byte_size()):
-							total_size = lump.fileofs + j
-							lump.data.append(ctype.frombytes(bytedata[total_size:total_size + ctype.byte_size()]))
-					else:
-						lump.data = ctype.frombytes(bytedata[lump.fileofs:lump.fileofs + lump.filelen])
-				else:
-					unresolved_lumps.append(i)
-
 		# In some cases there's 0 length set for a lump, but data is there,
 		# so calculate closest lump and get length from their positions
-		for ulidx in unresolved_lumps:
+		for lump in lumps:
+			if lump.mapping is None or lump.filelen > 0 or lump.index in optional_lumps:
+				continue
+
 			closest = 0
-			for i in range(BSPLumps.HEADER_LUMPS):
-				if (closest == 0 and lumps[i].fileofs > lumps[ulidx].fileofs) or (closest > lumps[i].fileofs > lumps[ulidx].fileofs):
-					closest = lumps[i].fileofs
+			for other in lumps:
+				if (closest == 0 and other.fileofs > lump.fileofs) or (closest > other.fileofs > lump.fileofs):
+					closest = other.fileofs
 
-			lump = lumps[ulidx]
 			lump.filelen = closest - lump.fileofs
-			assert lump.filelen > 0, f"Found lump with no size ({str(BSPLumps(ulidx))}), and wasn't able to fix lump size (estimated: {lump.filelen})"
+			lump.estimated = True
+
+		return cls([bytedata, data[0], data[1], lumps, struct.unpack("I", bytedata[-4:])[0]])
 
-			print(f"Found lump with no size ({str(BSPLumps(ulidx))}), new estimated size = {lump.filelen}.")
+	@property
+	def texture_names(self):
+		""" Texture names of every texdata entry (texdata index -> name) """
+		if self.__texture_names is None:
+			stringdata = self.lumps[BSPLumps.LUMP_TEXDATA_STRING_DATA].raw
+			stringtable = self.lumps[BSPLumps.LUMP_TEXDATA_STRING_TABLE].data
 
-			if type(lumps_mapping[BSPLumps(ulidx)]) == dict:
-				assert lump.version in lumps_mapping[
-					BSPLumps(ulidx)], f"Invalid or unsupported lump version {lump.version} for {str(BSPLumps(ulidx))}."
-				ctype = lumps_mapping[BSPLumps(ulidx)][lump.version]
-			else:
-				ctype = lumps_mapping[BSPLumps(ulidx)]
+			self.__texture_names = []
+			for txdata in self.lumps[BSPLumps.LUMP_TEXDATA].data:
+				offset = stringtable[txdata.nameStringTableID]
+				self.__texture_names.append(sys.intern(stringdata[offset:stringdata.find(b"\x00", offset)].decode("utf-8")))
 
-			if ctype.iterate_all():
-				assert lump.filelen % ctype.byte_size() == 0, f"Failed to parse {str(BSPLumps(ulidx))}, bogus section size ({lump.filelen} % {ctype.byte_size()})."
-				lump.data = []
+		return self.__texture_names
 
-				for j in range(0, lump.filelen, ctype.byte_size()):
-					lump.data.append(
-						ctype.frombytes(bytedata[lump.fileofs + j:lump.fileofs + j + ctype.byte_size()]))
-			else:
-				lump.data = ctype.frombytes(bytedata[lump.fileofs:lump.fileofs + lump.filelen])
+	def close(self):
+		if isinstance(self.raw_data, mmap.mmap):
+			try:
+				self.raw_data.close()
+			except BufferError:
+				# Lumps decoded as arrays are still referencing the mapping,
+				# it would be unmapped once all of them are released
+				pass
 
-		return cls([bytedata, data[0], data[1], lumps, struct.unpack("I", bytedata[-4:])[0]])
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
 
 	@staticmethod
 	def byte_size():
@@ -220,7 +338,114 @@ class lump_t(ByteSection):
 		self.filelen = data[1]
 		self.version = data[2]
 		self.fourCC = data[3:7]
-		self.data = None
+		self.index = None
+		# Whole .bsp file data, fileofs and filelen are the position of the lump in it
+		self.file = None
+		self.compressed = False
+		self.mapping = None
+		self.estimated = False
+		self.__decompressed = None
+		self.__ctype = None
+		self.__data = None
+		self.__array = None
+
+	@property
+	def data(self):
+		if self.__data is None and self.mapping is not None:
+			self.__data = self.decode()
+		return self.__data
+
+	@data.setter
+	def data(self, value):
+		self.__data = value
+
+	@property
+	def source(self):
+		""" Buffer the lump data is read from, decompressed on first access if the lump is LZMA compressed """
+		if not self.compressed:
+			return self.file
+
+		if self.__decompressed is None:
+			self.__decompressed = self.decompress()
+		return self.__decompressed
+
+	@property
+	def offset(self):
+		return 0 if self.compressed else self.fileofs
+
+	@property
+	def length(self):
+		# Compressed lumps store their uncompressed size in fourCC
+		return struct.unpack("<i", struct.pack("4b", *self.fourCC))[0] if self.compressed else self.filelen
+
+	def decompress(self):
+		ident, actual_size, lzma_size, properties = lzma_header.unpack_from(self.file, self.fileofs)
+		assert actual_size == self.length, f"Failed to decompress {str(self.index)}, lzma header size doesn't match lump fourCC ({actual_size} != {self.length})."
+		assert lzma_header.size + lzma_size <= self.filelen, f"Failed to decompress {str(self.index)}, lzma data is out of the lump bounds ({lzma_header.size + lzma_size} > {self.filelen})."
+
+		# properties is a lzma1 properties byte (lc, lp, pb) followed by the dictionary size
+		lc, lp, pb = properties[0] % 9, properties[0] // 9 % 5, properties[0] // 45
+		decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters = [{
+			"id": lzma.FILTER_LZMA1, "dict_size": int.from_bytes(properties[1:5], "little"), "lc": lc, "lp": lp, "pb": pb
+		}])
+
+		start = self.fileofs + lzma_header.size
+		with memoryview(self.file) as view, view[start:start + lzma_size] as bytedata:
+			data = decompressor.decompress(bytedata, actual_size)
+
+		assert len(data) == actual_size, f"Failed to decompress {str(self.index)}, got {len(data)} bytes instead of {actual_size}."
+		return data
+
+	@property
+	def array(self):
+		""" Lump as a numpy structured array (see ByteSection.dtype()), a zero-copy view over the file data """
+		if self.__array is None and self.mapping is not None:
+			ctype = self.ctype
+			assert self.length % ctype.dtype().itemsize == 0, f"Failed to parse {str(self.index)}, bogus section size ({self.length} % {ctype.dtype().itemsize})."
+			self.__array = np.frombuffer(self.source, dtype = ctype.dtype(), count = self.length // ctype.dtype().itemsize, offset = self.offset)
+		return self.__array
+
+	@property
+	def raw(self):
+		""" Undecoded lump data """
+		self.ctype
+		source = self.source
+		return bytes(source[self.offset:self.offset + self.length])
+
+	@property
+	def ctype(self):
+		if self.__ctype is None and self.mapping is not None:
+			if self.estimated:
+				assert self.filelen > 0, f"Found lump with no size ({str(self.index)}), and wasn't able to fix lump size (estimated: {self.filelen})"
+				print(f"Found lump with no size ({str(self.index)}), new estimated size = {self.filelen}.")
+
+			if type(self.mapping) == dict:
+				assert self.version in self.mapping, f"Invalid or unsupported lump version {self.version} for {str(self.index)}."
+				self.__ctype = self.mapping[self.version]
+			else:
+				self.__ctype = self.mapping
+		return self.__ctype
+
+	@property
+	def used(self):
+		""" Whether the lump was read in any way, its ctype is resolved on the first read """
+		return self.__ctype is not None
+
+	def decode(self):
+		ctype = self.ctype
+
+		source, offset, length = self.source, self.offset, self.length
+
+		if ctype.iterate_all():
+			assert length % ctype.byte_size() == 0, f"Failed to parse {str(self.index)}, bogus section size ({length} % {ctype.byte_size()})."
+
+			if ctype.layout is not None:
+				with memoryview(source) as view, view[offset:offset + length] as bytedata:
+					return ctype.decoder()(bytedata)
+
+			return [ctype.frombytes(source[i:i + ctype.byte_size()]) for i in range(offset, offset + length, ctype.byte_size())]
+
+		return ctype.frombytes(source[offset:offset + length])
 
 	@classmethod
 	def frombytes(cls, bytedata):
@@ -232,9 +457,11 @@ class lump_t(ByteSection):
 
 
 class dplane_t(ByteSection):
+	layout = (("normal", "f", 3), ("dist", "f", 1), ("type", "i", 1))
+
 	def __init__(self, data):
 		super().__init__(data)
-		self.normal = Vector(*data[0:3])
+		self.normal = Vector3(*data[0:3])
 		self.dist = data[3]
 		self.type = data[4]
 
@@ -248,9 +475,14 @@ class dplane_t(ByteSection):
 
 
 class dtexdata_t(ByteSection):
+	layout = (
+		("reflectivity", "f", 3), ("nameStringTableID", "I", 1), ("width", "I", 1), ("height", "I", 1),
+		("view_width", "I", 1), ("view_height", "I", 1)
+	)
+
 	def __init__(self, data):
 		super().__init__(data)
-		self.reflectivity = Vector(*data[0:3])
+		self.reflectivity = Vector3(*data[0:3])
 		self.nameStringTableID = data[3]
 		self.width = data[4]
 		self.height = data[5]
@@ -267,9 +499,11 @@ class dtexdata_t(ByteSection):
 
 
 class dvertex_t(ByteSection):
+	layout = (("point", "f", 3),)
+
 	def __init__(self, data):
 		super().__init__(data)
-		self.point = Vector(*data[0:3])
+		self.point = Vector3(*data[0:3])
 
 	@classmethod
 	def frombytes(cls, bytedata):
@@ -281,6 +515,11 @@ class dvertex_t(ByteSection):
 
 
 class texinfo_t(ByteSection):
+	layout = (
+		("textureVecsTexelsPerWorldUnits", "f", (2, 4)), ("lightmapVecsLuxelsPerWorldUnits", "f", (2, 4)),
+		("flags", "I", 1), ("texdata", "I", 1)
+	)
+
 	def __init__(self, data):
 		super().__init__(data)
 		self.textureVecsTexelsPerWorldUnits = (data[0:4], data[4:8])
@@ -297,7 +536,92 @@ class texinfo_t(ByteSection):
 		return 72
 
 
+class dleaf_t(ByteSection):
+	layout = (
+		("contents", "i", 1), ("cluster", "h", 1), ("areaflags", "H", 1), ("mins", "h", 3), ("maxs", "h", 3),
+		("firstleafface", "H", 1), ("numleaffaces", "H", 1), ("firstleafbrush", "H", 1), ("numleafbrushes", "H", 1),
+		("leafWaterDataID", "h", 1), ("padding", "x", 2)
+	)
+
+	def __init__(self, data):
+		super().__init__(data)
+		self.contents = data[0]
+		self.cluster = data[1]
+		self.areaflags = data[2]
+		self.mins = data[3:6]
+		self.maxs = data[6:9]
+		self.firstleafface = data[9]
+		self.numleaffaces = data[10]
+		self.firstleafbrush = data[11]
+		self.numleafbrushes = data[12]
+		self.leafWaterDataID = data[13]
+
+	# area:9 and flags:7 bitfields share a single short
+	@property
+	def area(self):
+		return self.areaflags & 0x1FF
+
+	@property
+	def flags(self):
+		return self.areaflags >> 9
+
+	@classmethod
+	def frombytes(cls, bytedata):
+		return cls(super().__frombytes__(bytedata, "ihH3h3h4Hh2x"))
+
+	@staticmethod
+	def byte_size():
+		return 32
+
+
+class dleaf_t_ver0(ByteSection):
+	# m_AmbientLighting is CompressedLightCube, 6 ColorRGBExp32 (r, g, b, exponent) kept as raw bytes
+	layout = (
+		("contents", "i", 1), ("cluster", "h", 1), ("areaflags", "H", 1), ("mins", "h", 3), ("maxs", "h", 3),
+		("firstleafface", "H", 1), ("numleaffaces", "H", 1), ("firstleafbrush", "H", 1), ("numleafbrushes", "H", 1),
+		("leafWaterDataID", "h", 1), ("m_AmbientLighting", "B", (6, 4)), ("padding", "x", 2)
+	)
+
+	def __init__(self, data):
+		super().__init__(data)
+		self.contents = data[0]
+		self.cluster = data[1]
+		self.areaflags = data[2]
+		self.mins = data[3:6]
+		self.maxs = data[6:9]
+		self.firstleafface = data[9]
+		self.numleaffaces = data[10]
+		self.firstleafbrush = data[11]
+		self.numleafbrushes = data[12]
+		self.leafWaterDataID = data[13]
+		self.m_AmbientLighting = tuple([data[i:i + 4] for i in range(14, 38, 4)])
+
+	@property
+	def area(self):
+		return self.areaflags & 0x1FF
+
+	@property
+	def flags(self):
+		return self.areaflags >> 9
+
+	@classmethod
+	def frombytes(cls, bytedata):
+		return cls(super().__frombytes__(bytedata, "ihH3h3h4Hh24B2x"))
+
+	@staticmethod
+	def byte_size():
+		return 56
+
+
 class dface_t(ByteSection):
+	layout = (
+		("planenum", "H", 1), ("side", "b", 1), ("onNode", "b", 1), ("firstedge", "i", 1), ("numedges", "h", 1),
+		("texinfo", "h", 1), ("dispinfo", "h", 1), ("surfaceFogVolumeID", "h", 1), ("styles", "b", 4),
+		("lightofs", "i", 1), ("area", "f", 1), ("m_LightmapTextureMinsInLuxels", "i", 2),
+		("m_LightmapTextureSizeInLuxels", "i", 2), ("origFace", "i", 1), ("numPrims", "H", 1),
+		("firstPrimID", "H", 1), ("smoothingGroups", "I", 1)
+	)
+
 	def __init__(self, data):
 		super().__init__(data)
 		self.planenum = data[0]
@@ -328,6 +652,8 @@ class dface_t(ByteSection):
 
 
 class dedge_t(ByteSection):
+	layout = (("v", "H", 2),)
+
 	def __init__(self, data):
 		super().__init__(data)
 		self.v = data
@@ -346,6 +672,11 @@ class surfedges_t(ByteSection):
 	def frombytes(cls, bytedata):
 		return super().__frombytes__(bytedata, "%di" % (len(bytedata) / cls.byte_size()))
 
+	@classmethod
+	def dtype(cls):
+		assert np is not None, "numpy is required to decode lumps as arrays!"
+		return np.dtype("<i4")
+
 	@staticmethod
 	def byte_size():
 		return 4
@@ -355,13 +686,39 @@ class surfedges_t(ByteSection):
 		return False
 
 
+class leaffaces_t(ByteSection):
+	@classmethod
+	def frombytes(cls, bytedata):
+		return super().__frombytes__(bytedata, "%dH" % (len(bytedata) / cls.byte_size()))
+
+	@classmethod
+	def dtype(cls):
+		assert np is not None, "numpy is required to decode lumps as arrays!"
+		return np.dtype("<u2")
+
+	@staticmethod
+	def byte_size():
+		return 2
+
+	@staticmethod
+	def iterate_all():
+		return False
+
+
 class dworldlight_t(ByteSection):
+	layout = (
+		("origin", "f", 3), ("intensity", "f", 3), ("normal", "f", 3), ("shadow_cast_offset", "f", 3),
+		("cluster", "I", 1), ("type", "I", 1), ("style", "I", 1), ("stopdot", "f", 1), ("stopdot2", "f", 1),
+		("exponent", "f", 1), ("radius", "f", 1), ("constant_attn", "f", 1), ("linear_attn", "f", 1),
+		("quadratic_attn", "f", 1), ("flags", "I", 1), ("texinfo", "I", 1), ("owner", "I", 1)
+	)
+
 	def __init__(self, data):
 		super().__init__(data)
-		self.origin = Vector(*data[0:3])
-		self.intensity = Vector(*data[3:6])
-		self.normal = Vector(*data[6:9])
-		self.shadow_cast_offset = Vector(*data[9:12])
+		self.origin = Vector3(*data[0:3])
+		self.intensity = Vector3(*data[3:6])
+		self.normal = Vector3(*data[6:9])
+		self.shadow_cast_offset = Vector3(*data[9:12])
 		self.cluster = data[12]
 		self.type = data[13]
 		self.style = data[14]
@@ -386,11 +743,18 @@ class dworldlight_t(ByteSection):
 
 
 class dworldlight_t_ver0(ByteSection):
+	layout = (
+		("origin", "f", 3), ("intensity", "f", 3), ("normal", "f", 3),
+		("cluster", "I", 1), ("type", "I", 1), ("style", "I", 1), ("stopdot", "f", 1), ("stopdot2", "f", 1),
+		("exponent", "f", 1), ("radius", "f", 1), ("constant_attn", "f", 1), ("linear_attn", "f", 1),
+		("quadratic_attn", "f", 1), ("flags", "I", 1), ("texinfo", "I", 1), ("owner", "I", 1)
+	)
+
 	def __init__(self, data):
 		super().__init__(data)
-		self.origin = Vector(*data[0:3])
-		self.intensity = Vector(*data[3:6])
-		self.normal = Vector(*data[6:9])
+		self.origin = Vector3(*data[0:3])
+		self.intensity = Vector3(*data[3:6])
+		self.normal = Vector3(*data[6:9])
 		self.cluster = data[9]
 		self.type = data[10]
 		self.style = data[11]
@@ -415,6 +779,8 @@ class dworldlight_t_ver0(ByteSection):
 
 
 class dbrush_t(ByteSection):
+	layout = (("firstside", "I", 1), ("numsides", "I", 1), ("contents", "I", 1))
+
 	def __init__(self, data):
 		super().__init__(data)
 		self.firstside = data[0]
@@ -431,6 +797,8 @@ class dbrush_t(ByteSection):
 
 
 class dbrushside_t(ByteSection):
+	layout = (("planenum", "H", 1), ("texinfo", "h", 1), ("dispinfo", "h", 1), ("bevel", "b", 1), ("thin", "b", 1))
+
 	def __init__(self, data):
 		super().__init__(data)
 		self.planenum = data[0]
@@ -469,7 +837,12 @@ class stringdata_t(ByteSection):
 
 	def __getitem__(self, key):
 		if isinstance(key, slice):
-			indices = range(*key.indices(len(self.__data)))
+			start, stop, step = key.indices(len(self.__data))
+			if step == 1:
+				end = self.__data.find('\x00', start, stop)
+				return self.__data[start:end if end != -1 else max(start, stop - 1)]
+
+			indices = range(start, stop, step)
 			name = "".join([self.__data[i] for i in indices])
 			return name[:name.find('\x00')]
 		return self.__data[key]
@@ -480,6 +853,11 @@ class stringtable_t(ByteSection):
 	def frombytes(cls, bytedata):
 		return super().__frombytes__(bytedata, "%di" % (len(bytedata) / cls.byte_size()))
 
+	@classmethod
+	def dtype(cls):
+		assert np is not None, "numpy is required to decode lumps as arrays!"
+		return np.dtype("<i4")
+
 	@staticmethod
 	def byte_size():
 		return 4
@@ -509,6 +887,8 @@ class stringtable_t(ByteSection):
 	so you should define how parsing should be done yourself inside frombytes() method,
 	byte_size() in this case isn't called (only if you don't call super().__frombytes__())
 	and you can leave whatever you want there. (eg. LUMP_TEXDATA_STRING_DATA, LUMP_TEXDATA_STRING_TABLE, LUMP_SURFEDGES)
+	Note3: If you want your lump to be accessible as a numpy array (lump.array), describe its fields
+	in the layout class member, the same way it's done for the other structures, numpy dtype is built from it.
 """
 
 lumps_mapping = {
@@ -516,12 +896,21 @@ lumps_mapping = {
 	BSPLumps.LUMP_TEXDATA: dtexdata_t,
 	BSPLumps.LUMP_VERTEXES: dvertex_t,
 	BSPLumps.LUMP_TEXINFO: texinfo_t,
+	BSPLumps.LUMP_LEAFS: {0: dleaf_t_ver0, 1: dleaf_t},
 	BSPLumps.LUMP_FACES: dface_t,
+	BSPLumps.LUMP_LEAFFACES: leaffaces_t,
 	BSPLumps.LUMP_EDGES: dedge_t,
 	BSPLumps.LUMP_SURFEDGES: surfedges_t,
 	BSPLumps.LUMP_WORLDLIGHTS: {0: dworldlight_t_ver0, 1: dworldlight_t},
+	BSPLumps.LUMP_WORLDLIGHTS_HDR: {0: dworldlight_t_ver0, 1: dworldlight_t},
 	BSPLumps.LUMP_BRUSHES: dbrush_t,
 	BSPLumps.LUMP_BRUSHSIDES: dbrushside_t,
 	BSPLumps.LUMP_TEXDATA_STRING_DATA: stringdata_t,
 	BSPLumps.LUMP_TEXDATA_STRING_TABLE: stringtable_t
 }
+
+# Lumps that are left empty by the maps that don't have them (eg. LDR only maps have no LUMP_WORLDLIGHTS_HDR),
+# their size is never estimated
+optional_lumps = {
+	BSPLumps.LUMP_WORLDLIGHTS_HDR
+}
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import struct
+import sqlite3
+import hashlib
+
+
+class SqliteStore:
+	""" Json encoded entries stored by a text key in a sqlite table, least recently used entries of all stores are evicted over maxsize """
+
+	# Table of the store, and names of its key and value columns
+	table = None
+	columns = None
+
+	def __init__(self, path, maxsize):
+		if os.path.dirname(path):
+			os.makedirs(os.path.dirname(path), exist_ok = True)
+
+		self.maxsize = maxsize
+		self.db = sqlite3.connect(path, timeout = 60)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		# Tables of all of the stores are created, so evict() can count them no matter which stores were used
+		for store in SqliteStore.__subclasses__():
+			key, value = store.columns
+			self.db.execute(f"CREATE TABLE IF NOT EXISTS {store.table} ({key} TEXT PRIMARY KEY, {value} TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+			self.db.execute(f"CREATE INDEX IF NOT EXISTS {store.table}_accessed ON {store.table} (accessed)")
+		self.db.commit()
+
+	def get(self, key):
+		row = self.db.execute(f"SELECT {self.columns[1]} FROM {self.table} WHERE {self.columns[0]} = ?", (key,)).fetchone()
+		if row is None:
+			return None
+
+		self.db.execute(f"UPDATE {self.table} SET accessed = ? WHERE {self.columns[0]} = ?", (time.time(), key))
+		self.db.commit()
+		return json.loads(row[0])
+
+	def put(self, key, value):
+		data = json.dumps(value)
+		self.db.execute(f"INSERT OR REPLACE INTO {self.table} ({', '.join(self.columns)}, size, accessed) VALUES (?, ?, ?, ?)", (key, data, len(data), time.time()))
+		self.evict()
+		self.db.commit()
+
+	def evict(self):
+		stores = SqliteStore.__subclasses__()
+		total = sum([self.db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {x.table}").fetchone()[0] for x in stores])
+		if total <= self.maxsize:
+			return
+
+		entries = " UNION ALL ".join([f"SELECT '{x.table}', {x.columns[0]}, size, accessed FROM {x.table}" for x in stores])
+		for table, key, size, accessed in self.db.execute(f"SELECT * FROM ({entries}) ORDER BY 4").fetchall():
+			if total <= self.maxsize:
+				break
+			store = next(x for x in stores if x.table == table)
+			self.db.execute(f"DELETE FROM {table} WHERE {store.columns[0]} = ?", (key,))
+			total = total - size
+
+	def close(self):
+		self.db.close()
+
+
+class ResultCache(SqliteStore):
+	""" Extraction results keyed by the content hash of the map, its revision and the settings """
+
+	table = "results"
+	columns = ("key", "result")
+
+	@staticmethod
+	def default_path():
+		root = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+		return os.path.join(root, "lightsradextractor", "results.sqlite3")
+
+	@staticmethod
+	def file_hash(path):
+		digest = hashlib.blake2b(digest_size = 20)
+		buffer = bytearray(1 << 20)
+		view = memoryview(buffer)
+
+		with open(path, "rb", buffering = 0) as inp:
+			while True:
+				size = inp.readinto(buffer)
+				if not size:
+					break
+				digest.update(view[:size])
+
+		return digest.hexdigest()
+
+	@staticmethod
+	def map_revision(path):
+		# Same as BSPFile.map_revision
+		with open(path, "rb") as inp:
+			inp.seek(-4, os.SEEK_END)
+			return struct.unpack("I", inp.read(4))[0]
+
+	def key(self, path, *settings):
+		return "|".join([self.file_hash(path), str(self.map_revision(path)), *[str(x) for x in settings]])
+
+
+class PatchStore(SqliteStore):
+	""" Light faces and patches of the last extraction of every map, with the hashes of the lumps they are made of """
+
+	table = "patches"
+	columns = ("path", "state")
+	# Version of the stored state, states of the other versions are ignored
+	layout = 2
+
+	# Lumps that affect which faces are the light faces, their points and luxel scale
+	lumps = ("LUMP_VERTEXES", "LUMP_EDGES", "LUMP_SURFEDGES", "LUMP_FACES", "LUMP_TEXINFO", "LUMP_TEXDATA", "LUMP_TEXDATA_STRING_DATA", "LUMP_TEXDATA_STRING_TABLE")
+
+	@staticmethod
+	def lump_hash(lump):
+		# Stored lump bytes are hashed, so compressed lumps aren't decompressed just to be compared
+		with memoryview(lump.file) as view:
+			return hashlib.blake2b(view[lump.fileofs:lump.fileofs + lump.filelen], digest_size = 20).hexdigest()
+
+	def get(self, path):
+		return super().get(os.path.abspath(path))
+
+	def put(self, path, state):
+		super().put(os.path.abspath(path), state)
@@ -1,130 +1,1056 @@
 import os
+import io
+import sys
+import json
 import math
+import bisect
+import stat
 import time
+import sqlite3
+import contextlib
+import socketserver
+import multiprocessing
 from bsplib import *
-from shapes import Polygon, Shape
+from shapes import Polygon, Shape, PatchGrid, PlaneBuckets, BoxIndex, SubdivisionCache
+import batchsubdivide
+from vector import Vector3
+from cache import ResultCache, PatchStore
+from stats import Stats
+from sharedgeometry import SharedGeometry
+from watcher import DirectoryWatcher
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
+__version__ = "1.0.0"
+
 ProcessArgs = None
+Cache = None
+Subdivisions = None
+MapPool = None
+Patches = None
 
-def main():
-	starttime = time.time()
+def batch_subdivision():
+	""" Whether the faces are subdivided with numpy """
+	return ProcessArgs.subdivision == "numpy" or (ProcessArgs.subdivision == "auto" and batchsubdivide.available())
 
-	for path in ProcessArgs.filepath:
-		if not os.path.exists(path):
-			print(f"No file were found under {path} path, skipping...")
+
+def subdivide_faces(faces, luxscales):
+	""" Subdivides every face with its luxel scale, returns a shape or an exception it has failed with for each """
+	if batch_subdivision():
+		return batchsubdivide.subdivide_faces(faces, luxscales)
+
+	results = []
+	for points, luxscale in zip(faces, luxscales):
+		try:
+			results.append(Shape.subdivide_poly_to_shape(Polygon(points), luxscale))
+		except Exception as e:
+			results.append(e)
+
+	return results
+
+
+def subdivide(lightfaces, known = None, used = None, stats = None):
+	""" Subdivides (faceidx, points, luxscale) light faces into (shape, faceidx), reusing the known shapes and appending the used ones to used """
+	if known is None and used is None:
+		results = subdivide_repeated([x[1] for x in lightfaces], [x[2] for x in lightfaces])
+	else:
+		# Faces that aren't known are subdivided, each distinct one only once
+		results = [None] * len(lightfaces)
+		keys = []
+		pending = dict()
+		reused = 0
+
+		for i, (faceidx, points, luxscale) in enumerate(lightfaces):
+			key = SubdivisionCache.key(points, luxscale)
+			keys.append(key)
+
+			if known is not None and key in known:
+				results[i] = known[key]
+				reused = reused + 1
+			elif key in pending:
+				pending[key][2].append(i)
+			else:
+				pending[key] = (points, luxscale, [i])
+
+		subdivided = subdivide_repeated([x[0] for x in pending.values()], [x[1] for x in pending.values()])
+
+		for (points, luxscale, indices), result in zip(pending.values(), subdivided):
+			for i in indices:
+				results[i] = result
+
+		if used is not None:
+			used.extend([(faceidx, key, result) for (faceidx, points, luxscale), key, result in zip(lightfaces, keys, results)])
+
+		if stats is not None and known is not None:
+			stats.count("faces reused", reused)
+
+	return shapes_of(lightfaces, results)
+
+
+def subdivide_gathered(lightfaces, points, counts):
+	""" Same as subdivide(), but with the points of the faces gathered by batchsubdivide.gather_faces() """
+	return shapes_of(lightfaces, batchsubdivide.subdivide_points(points, counts, [x[2] for x in lightfaces]))
+
+
+def shapes_of(lightfaces, results):
+	""" Returns (shape, faceidx) of the subdivided light faces, faces that failed to subdivide are reported and left out """
+	shapes = []
+	for (faceidx, points, luxscale), result in zip(lightfaces, results):
+		if isinstance(result, Exception):
+			print('Failed to construct a Shape. Reason:', result)
+		else:
+			shapes.append((result, faceidx))
+
+	return shapes
+
+
+def subdivide_repeated(faces, luxscales):
+	""" Same as subdivide_faces(), but faces that only differ by their position are subdivided once with the subdivision cache """
+	global Subdivisions
+
+	if ProcessArgs.subdivision_cache <= 0:
+		return subdivide_faces(faces, luxscales)
+
+	# Kept for the lifetime of the process, so faces repeated across the maps are reused as well
+	if Subdivisions is None:
+		Subdivisions = SubdivisionCache(ProcessArgs.subdivision_cache)
+
+	results = [None] * len(faces)
+	origins = []
+	pending = dict()
+
+	for i, (points, luxscale) in enumerate(zip(faces, luxscales)):
+		origin, points = SubdivisionCache.normalize(points)
+		key = SubdivisionCache.key(points, luxscale)
+		origins.append(origin)
+
+		results[i] = Subdivisions.relative(key)
+		if results[i] is None:
+			if key in pending:
+				pending[key][2].append(i)
+			else:
+				pending[key] = (points, luxscale, [i])
+
+	subdivided = subdivide_faces([x[0] for x in pending.values()], [x[1] for x in pending.values()])
+
+	for (key, (points, luxscale, indices)), result in zip(pending.items(), subdivided):
+		Subdivisions.put(key, result)
+		for i in indices:
+			results[i] = result
+
+	return [x if isinstance(x, Exception) else x.translated(origin) for x, origin in zip(results, origins)]
+
+
+def subdivide_incremental(path, hashes, collect, stats = None):
+	""" Same as subdivide(collect()), but reuses the light faces and patches stored by the previous extraction of the map """
+	global Patches
+
+	try:
+		# Opened on the first use, same as the result cache
+		if Patches is None:
+			Patches = PatchStore(ProcessArgs.cache_path, ProcessArgs.cache_size * 1024 * 1024)
+
+		state = Patches.get(path)
+	except (OSError, sqlite3.Error) as e:
+		disable_cache(e)
+		return subdivide(collect())
+
+	settings = [__version__, PatchStore.layout, ProcessArgs.quick_search, ProcessArgs.subdivision_cache > 0]
+	if state is not None and state["settings"] != settings:
+		state = None
+
+	# (SubdivisionCache key, shape or exception) of every distinct light face
+	known = []
+	for points, luxscale, data in (state or dict()).get("shapes", []):
+		known.append(((tuple([tuple(x) for x in points]), luxscale), AssertionError(data) if isinstance(data, str) else Shape.fromlist(data)))
+
+	if state is not None and state["hashes"] == hashes:
+		# None of the lumps the light faces are made of has changed, so they are the same as the last time
+		shapes = []
+		for faceidx, shapeidx in state["faces"]:
+			result = known[shapeidx][1]
+			if isinstance(result, Exception):
+				print('Failed to construct a Shape. Reason:', result)
+			else:
+				shapes.append((result, faceidx))
+
+		if stats is not None:
+			stats.count("faces reused", len(state["faces"]))
+		return shapes
+
+	used = []
+	shapes = subdivide(collect(), dict(known), used, stats)
+
+	indices = dict()
+	state = {"settings": settings, "hashes": hashes, "shapes": [], "faces": []}
+	for faceidx, key, result in used:
+		if key not in indices:
+			indices[key] = len(state["shapes"])
+			state["shapes"].append([[list(x) for x in key[0]], key[1], str(result) if isinstance(result, Exception) else result.tolist()])
+		state["faces"].append([faceidx, indices[key]])
+
+	try:
+		Patches.put(path, state)
+	except sqlite3.Error as e:
+		disable_cache(e)
+
+	return shapes
+
+
+def collect_light_faces(faces, texinfo, texnames, edges, surfedges, verts, quick_search, stats = None, points = True):
+	""" Returns (faceidx, points, luxscale) of every face with a light texture, points are left as None with points = False """
+	lightfaces = []
+	foundtextures = []
+	numlightfaces = 0
+
+	for faceidx, face in enumerate(faces):
+		tx: texinfo_t = texinfo[face.texinfo]
+		if tx.flags & SURFFlags.SURF_LIGHT:
+			texture = texnames[tx.texdata]
+			numlightfaces = numlightfaces + 1
+
+			if quick_search and texture in foundtextures:
+				continue
+
+			surfedges_list = []
+			chopscale = [0, 0]
+
+			for i in range(2):
+				for j in range(3):
+					chopscale[i] = chopscale[i] + (tx.lightmapVecsLuxelsPerWorldUnits[i][j] ** 2)
+				chopscale[i] = math.sqrt(chopscale[i])
+
+			for i in range(face.numedges if points else 0):
+				edgeidx = surfedges[face.firstedge + i]
+				v = edges[abs(edgeidx)].v
+
+				surfedges_list.append(verts[v[1 if edgeidx < 0 else 0]].point)
+
+			lightfaces.append((faceidx, surfedges_list if points else None, (chopscale[0] + chopscale[1]) / 2))
+			foundtextures.append(texture)
+
+	if stats is not None:
+		stats.count("faces scanned", len(faces))
+		stats.count("SURF_LIGHT faces", numlightfaces)
+
+	return lightfaces
+
+
+def texinfo_groups(faceindices, faces):
+	""" Returns texinfo -> indices into faceindices of the faces that have it """
+	groups = dict()
+	for i, faceidx in enumerate(faceindices):
+		groups.setdefault(faces[faceidx].texinfo, []).append(i)
+	return groups
+
+
+def cluster_groups(faceindices, leafs, leaffaces):
+	""" Returns visibility cluster -> indices into faceindices of the faces that are in any of the leafs of the cluster """
+	indexof = {faceidx: i for i, faceidx in enumerate(faceindices)}
+	groups = dict()
+
+	for leaf in leafs:
+		if leaf.cluster < 0:
 			continue
 
-		with open(path, "rb") as inp:
-			try:
-				print(f"Parsing {path}:")
-				bsp = BSPFile.frombytes(inp.read())
-			except Exception as e:
-				print(f"{e}, skipping...")
+		for i in range(leaf.firstleafface, leaf.firstleafface + leaf.numleaffaces):
+			if i < len(leaffaces) and leaffaces[i] in indexof:
+				groups.setdefault(leaf.cluster, set()).add(indexof[leaffaces[i]])
+
+	return {key: sorted(value) for key, value in groups.items()}
+
+
+class ScanOrder:
+	""" Order in which the original extraction loop tests the light faces for every light """
+
+	def __init__(self, textures):
+		self.textures = textures
+		self.remaining = list(range(len(textures)))
+		# Remaining light faces whose texture was found, ordered
+		self.found = []
+		self.foundtextures = set()
+
+	def position(self, index):
+		pos = bisect.bisect_left(self.remaining, index)
+		return pos if pos < len(self.remaining) and self.remaining[pos] == index else -1
+
+	def testable(self, index):
+		""" Returns whether the light face with a texture that wasn't found yet would be tested by the walk """
+		pos = self.position(index)
+		if pos == -1 or self.textures[index] in self.foundtextures:
+			return False
+
+		run = 0
+		while pos - run - 1 >= 0 and self.textures[self.remaining[pos - run - 1]] in self.foundtextures:
+			run = run + 1
+		return run % 2 == 0
+
+	def walk(self, until = None):
+		""" Removes the light faces the walk removes before it gets to the until light face, or to the end of the list """
+		end = self.position(until) if until is not None else len(self.remaining)
+		removed = []
+		previous = offset = -1
+
+		for index in self.found:
+			pos = self.position(index)
+			if pos >= end:
+				break
+
+			offset = offset + 1 if pos == previous + 1 else 0
+			if offset % 2 == 0:
+				removed.append(index)
+			previous = pos
+
+		for index in removed:
+			self.remove(index)
+
+	def match(self, index):
+		""" Walks up to the light face that was matched, removes it and marks its texture as found """
+		self.walk(index)
+		self.remove(index)
+
+		texture = self.textures[index]
+		self.foundtextures.add(texture)
+		for other in self.remaining:
+			if self.textures[other] == texture:
+				bisect.insort(self.found, other)
+
+	def remove(self, index):
+		del self.remaining[self.position(index)]
+		pos = bisect.bisect_left(self.found, index)
+		if pos < len(self.found) and self.found[pos] == index:
+			del self.found[pos]
+
+
+class LazyScanOrder:
+	""" Same order as the ScanOrder, for the light faces that are only subdivided once it depends on whether they subdivide """
+
+	def __init__(self, textures, exists):
+		self.textures = textures
+		self.exists = exists
+		self.existing = dict()
+		# ("walk", until) and ("match", index) in the order they were made, texture -> position of its match in them
+		self.events = []
+		self.foundat = dict()
+
+	def resolve(self, index):
+		""" Returns whether the light face subdivides """
+		if index not in self.existing:
+			self.existing[index] = self.exists(index)
+		return self.existing[index]
+
+	def testable(self, index):
+		""" Returns whether the light face with a texture that wasn't found yet would be tested by the walk """
+		if self.textures[index] in self.foundat:
+			return False
+
+		# The closest preceding light face that subdivides and whose texture isn't found was never removed and has ended
+		# every run of the walk, so only the light faces after it are walked over again. They all have found textures
+		run = []
+		for other in range(index - 1, -1, -1):
+			if self.textures[other] in self.foundat:
+				run.append(other)
+			elif self.resolve(other):
+				break
+		run = [x for x in reversed(run) if self.resolve(x)]
+
+		# Faces aren't walked over before their textures are found, matching one of them finds its texture
+		start = min([self.foundat[self.textures[x]] for x in run], default = len(self.events))
+		for position in range(start, len(self.events)):
+			if not run:
+				break
+
+			kind, target = self.events[position]
+			if kind == "match":
+				if target in run:
+					run.remove(target)
 				continue
 
-		edges = bsp.lumps[BSPLumps.LUMP_EDGES].data
-		surfedges = bsp.lumps[BSPLumps.LUMP_SURFEDGES].data
-		verts = bsp.lumps[BSPLumps.LUMP_VERTEXES].data
-		texinfo = bsp.lumps[BSPLumps.LUMP_TEXINFO].data
-		texdata = bsp.lumps[BSPLumps.LUMP_TEXDATA].data
-		stringdata = bsp.lumps[BSPLumps.LUMP_TEXDATA_STRING_DATA].data
-		stringtable = bsp.lumps[BSPLumps.LUMP_TEXDATA_STRING_TABLE].data
-		faces = bsp.lumps[BSPLumps.LUMP_FACES].data
+			removed = set()
+			offset = -1
+			inrun = False
+			for other in run:
+				if target is not None and other >= target:
+					break
 
-		shapes = []
-		foundtextures = []
+				if self.foundat[self.textures[other]] < position:
+					offset = offset + 1 if inrun else 0
+					if offset % 2 == 0:
+						removed.add(other)
+					inrun = True
+				else:
+					inrun = False
+
+			if removed:
+				run = [x for x in run if x not in removed]
+
+		return len(run) % 2 == 0
+
+	def walk(self, until = None):
+		self.events.append(("walk", until))
+
+	def match(self, index):
+		self.walk(index)
+		self.foundat[self.textures[index]] = len(self.events)
+		self.events.append(("match", index))
+
+
+def match_groups(faceindices, faces, leafs, leaffaces):
+	""" Returns groups and light_group for match_lights() picked by --match, or None for both with geometric matching """
+	if ProcessArgs.match == "texinfo":
+		return texinfo_groups(faceindices, faces), lambda x: x.texinfo
+	elif ProcessArgs.match == "cluster" and leafs is not None:
+		return cluster_groups(faceindices, leafs, leaffaces), lambda x: x.cluster
+
+	return None, None
+
+
+def light_color(light, tx, txdata, area):
+	""" Returns the color of the light texture from the surface light and the area of the patch it was matched to """
+	scale = [0, 0]
+	for i in range(2):
+		for j in range(3):
+			scale[i] = scale[i] + (tx.textureVecsTexelsPerWorldUnits[i][j] ** 2)
+		scale[i] = math.sqrt(scale[i])
+
+	basecolor = (light.intensity * 255 / (100 * 100)) * (txdata.width * txdata.height / (scale[0] * scale[1] * area))
+
+	# Here's few variations of code where all produce different results
+	# the one currently used is the most consistent one that produces 100% match to the original
+	"""rgb = light.intensity.normalize_toscale()
+	realrgb = ((rgb / 255) ** (1 / 2.2)) * 255
+	foundtextures[texture] = [realrgb, round(max(basecolor) / max(rgb))]"""
+
+	"""clr = light.intensity.normalize() ** (1 / 2.2)
+	newclr = clr
+	if max(clr) > 1.0:
+		newclr = newclr.scale(1 / max(clr))
+	foundtextures[texture] = [newclr.scale(255).scale(((round(max(basecolor) / max(rgb)) ** 0.85) * 0.002) + 1), round(max(basecolor) / max(rgb))]"""
+
+	realrgb = ((basecolor / 255) ** (1 / 2.2)) * 255
+	return Vector3(*[round(x) for x in realrgb])
+
+
+def match_lights(shapes, lights, faces, texinfo, texdata, texnames, search_distance, groups = None, light_group = None, planes = None, stats = None):
+	""" Matches surface lights to the patches of the (shape, faceidx) shapes, returns found textures (texture -> [rgb]) """
+	foundtextures = dict()
+
+	def index(indices):
+		if planes is None:
+			grid = PatchGrid(max(search_distance, 1))
+			for shapeidx in indices:
+				grid.add(shapeidx, shapes[shapeidx][0])
+		else:
+			grid = PlaneBuckets(max(search_distance, 1), planes)
+			for shapeidx in indices:
+				grid.add(shapeidx, shapes[shapeidx][0], faces[shapes[shapeidx][1]].planenum)
+		return grid
+
+	# Each light is only tested against the patches around it, in the same order as the shapes were made,
+	# shapes are skipped the same way the original loop over all of them skips them, see ScanOrder.
+	# Grid over all of the shapes is only built once a light needs it
+	grid = None
+	grids = dict()
+	for key, indices in (groups or dict()).items():
+		grids[key] = index(indices)
+	order = ScanOrder([texnames[texinfo[faces[faceidx].texinfo].texdata] for shape, faceidx in shapes])
+	fallbacks = 0
+
+	for light in lights:
+		if light.type == EmitType.emit_surface:
+			# Group of the light is unusable if it's out of range or has none of the light faces in it
+			search = grids.get(light_group(light)) if groups is not None else None
+			if search is None:
+				if grid is None:
+					grid = index(range(len(shapes)))
+
+				search = grid
+				if groups is not None:
+					fallbacks = fallbacks + 1
+
+			matched = False
+			for shapeidx, poly in search.query(light.origin, search_distance):
+				if not order.testable(shapeidx):
+					continue
+
+				shape, faceidx = shapes[shapeidx]
+				face: dface_t = faces[faceidx]
+				tx: texinfo_t = texinfo[face.texinfo]
+				txdata: dtexdata_t = texdata[tx.texdata]
+				texture = texnames[tx.texdata]
+
+				foundtextures[texture] = [light_color(light, tx, txdata, poly.area)]
+
+				lights.remove(light)
+				order.match(shapeidx)
+				matched = True
+
+				break
+
+			if not matched:
+				order.walk()
+
+	if stats is not None:
+		stats.count("close_enough calls", sum([x.tests for x in [grid, *grids.values()] if x is not None]))
+		if groups is not None:
+			stats.count("match fallbacks", fallbacks)
+		if planes is not None:
+			stats.count("plane buckets rejected", sum([x.rejected for x in [grid, *grids.values()] if x is not None]))
+
+	return foundtextures
+
+
+def match_lights_on_demand(lightfaces, lights, faces, texinfo, texdata, texnames, search_distance, groups = None, light_group = None, stats = None, shapes = None):
+	""" Same as subdivide() followed by match_lights(), but the faces are only subdivided once they are needed """
+	foundtextures = dict()
+
+	def index(indices):
+		boxes = BoxIndex(max(search_distance, 64))
+		for i in indices:
+			boxes.add(i, lightfaces[i][1])
+		return boxes
+
+	boxes = None
+	indexes = dict()
+	for key, indices in (groups or dict()).items():
+		indexes[key] = index(indices)
+	# Light face index -> Shape, or None if it failed to subdivide
+	if shapes is None:
+		shapes = dict()
+
+	def exists(i):
+		if i not in shapes:
+			subdivided = subdivide([lightfaces[i]])
+			shapes[i] = subdivided[0][0] if len(subdivided) > 0 else None
+			if stats is not None:
+				stats.count("faces subdivided")
+				stats.count("patches", len(shapes[i].polys) if shapes[i] is not None else 0)
 
-		for faceidx, face in enumerate(bsp.lumps[BSPLumps.LUMP_FACES].data):
-			tx: texinfo_t = texinfo[face.texinfo]
-			if tx.flags & SURFFlags.SURF_LIGHT:
+		return shapes[i] is not None
+
+	order = LazyScanOrder([texnames[texinfo[faces[x[0]].texinfo].texdata] for x in lightfaces], exists)
+	fallbacks = 0
+	tests = 0
+
+	for light in lights:
+		if light.type == EmitType.emit_surface:
+			search = indexes.get(light_group(light)) if groups is not None else None
+			if search is None:
+				if boxes is None:
+					boxes = index(range(len(lightfaces)))
+
+				search = boxes
+				if groups is not None:
+					fallbacks = fallbacks + 1
+
+			# Boxes are tested in the order of the faces, so the first face with a patch close enough
+			# is the same one match_lights() would pick
+			matched = False
+			for i in search.query(light.origin, search_distance):
+				if not order.testable(i) or not order.resolve(i):
+					continue
+
+				faceidx = lightfaces[i][0]
+				face: dface_t = faces[faceidx]
+				tx: texinfo_t = texinfo[face.texinfo]
 				txdata: dtexdata_t = texdata[tx.texdata]
-				texture = stringdata[stringtable[txdata.nameStringTableID]:]
+				texture = texnames[tx.texdata]
+
+				poly = None
+				for patch in shapes[i].polys:
+					tests = tests + 1
+					if patch.center.close_enough(light.origin, search_distance):
+						poly = patch
+						break
 
-				if ProcessArgs.quick_search and texture in foundtextures:
+				if poly is None:
 					continue
 
-				surfedges_list = []
-				chopscale = [0, 0]
+				foundtextures[texture] = [light_color(light, tx, txdata, poly.area)]
 
-				for i in range(2):
-					for j in range(3):
-						chopscale[i] = chopscale[i] + (tx.lightmapVecsLuxelsPerWorldUnits[i][j] ** 2)
-					chopscale[i] = math.sqrt(chopscale[i])
+				lights.remove(light)
+				order.match(i)
+				matched = True
 
-				for i in range(face.numedges):
-					edgeidx = surfedges[face.firstedge + i]
-					points = edges[abs(edgeidx)].v
+				break
 
-					surfedges_list.append(verts[points[1 if edgeidx < 0 else 0]].point)
+			if not matched:
+				order.walk()
 
-				try:
-					shapes.append((Shape.subdivide_poly_to_shape(Polygon(surfedges_list), (chopscale[0] + chopscale[1]) / 2), faceidx))
-				except Exception as e:
-					print('Failed to construct a Shape. Reason:', e)
-				foundtextures.append(texture)
+	if stats is not None:
+		stats.count("boxes tested", sum([x.tests for x in [boxes, *indexes.values()] if x is not None]))
+		stats.count("close_enough calls", tests)
+		if groups is not None:
+			stats.count("match fallbacks", fallbacks)
+
+	return foundtextures
+
+
+def match_chunk(task):
+	""" Worker part of match_lights_parallel(), subdivides a chunk of the light faces and finds the patches close to the lights """
+	handle, start, chunk, origins, search_distance = task
+
+	geometry = SharedGeometry.attach(*handle)
+	try:
+		# Indices of the faces take place of faceidx, so the shapes are keyed by them
+		lightfaces = [(i, geometry.points(firstedge, numedges), luxscale) for i, (firstedge, numedges, luxscale) in enumerate(chunk, start)]
+	finally:
+		geometry.close()
+
+	with io.StringIO() as output:
+		with contextlib.redirect_stdout(output):
+			shapes = subdivide(lightfaces)
+		printed = output.getvalue()
+
+	grid = PatchGrid(max(search_distance, 1))
+	for shape, i in shapes:
+		grid.add(i, shape)
 
+	candidates = dict()
+	for key, origin in origins:
+		first = []
+		for i, poly in grid.query(Vector3(*origin), search_distance):
+			if len(first) == 0 or first[-1][0] != i:
+				first.append((i, poly.area))
+
+		if len(first) > 0:
+			candidates[key] = first
+
+	return printed, [x[1] for x in shapes], candidates, sum([len(x[0].polys) for x in shapes]), grid.tests
+
+
+def match_lights_parallel(lightfaces, lightsets, faces, texinfo, texdata, texnames, search_distance, geometry, grouping, stats = None):
+	""" Same as subdivide() followed by match_lights() for every list of lights in lightsets, with the processes of MapPool """
+	chunksize = max(math.ceil(len(lightfaces) / (ProcessArgs.map_jobs * 4)), 1)
+	origins = []
+	for setidx, lights in enumerate(lightsets):
+		origins.extend([((setidx, lightidx), tuple(light.origin)) for lightidx, light in enumerate(lights) if light.type == EmitType.emit_surface])
+
+	tasks = []
+	for start in range(0, len(lightfaces), chunksize):
+		chunk = [(faces[faceidx].firstedge, faces[faceidx].numedges, luxscale) for faceidx, points, luxscale in lightfaces[start:start + chunksize]]
+		tasks.append((geometry.handle, start, chunk, origins, search_distance))
+
+	subdivided = []
+	candidates = dict()
+	patches = tests = 0
+
+	for printed, indices, found, numpatches, numtests in MapPool.map(match_chunk, tasks):
+		print(printed, end = "")
+		subdivided.extend(indices)
+		for key, value in found.items():
+			candidates.setdefault(key, []).extend(value)
+		patches = patches + numpatches
+		tests = tests + numtests
+
+	groups, light_group = grouping([lightfaces[i][0] for i in subdivided])
+	if groups is not None:
+		groups = {key: set([subdivided[x] for x in indices]) for key, indices in groups.items()}
+
+	foundsets = []
+	fallbacks = 0
+
+	# Positions of the subdivided faces in the list of the shapes subdivide() would have made
+	shapeof = {i: shapeidx for shapeidx, i in enumerate(subdivided)}
+	textures = [texnames[texinfo[faces[lightfaces[i][0]].texinfo].texdata] for i in subdivided]
+
+	for setidx, lights in enumerate(lightsets):
 		foundtextures = dict()
-		lights = list(bsp.lumps[BSPLumps.LUMP_WORLDLIGHTS].data)
+		order = ScanOrder(textures)
+		lightindices = {id(light): lightidx for lightidx, light in enumerate(lights)}
 
 		for light in lights:
 			if light.type == EmitType.emit_surface:
-				for shape, faceidx in shapes:
-					face: dface_t = faces[faceidx]
+				group = groups.get(light_group(light)) if groups is not None else None
+				if groups is not None and group is None:
+					fallbacks = fallbacks + 1
+
+				matched = False
+				for i, area in candidates.get((setidx, lightindices[id(light)]), ()):
+					if (group is not None and i not in group) or not order.testable(shapeof[i]):
+						continue
+
+					face: dface_t = faces[lightfaces[i][0]]
 					tx: texinfo_t = texinfo[face.texinfo]
 					txdata: dtexdata_t = texdata[tx.texdata]
-					texture = stringdata[stringtable[txdata.nameStringTableID]:]
+					texture = texnames[tx.texdata]
 
-					if texture in foundtextures:
-						shapes.remove((shape, faceidx))
-						continue
+					foundtextures[texture] = [light_color(light, tx, txdata, area)]
 
-					poly: Polygon = shape.close_enough(light.origin, ProcessArgs.search_distance)
+					lights.remove(light)
+					order.match(shapeof[i])
+					matched = True
 
-					if poly is not None:
-						scale = [0, 0]
-						for i in range(2):
-							for j in range(3):
-								scale[i] = scale[i] + (tx.textureVecsTexelsPerWorldUnits[i][j] ** 2)
-							scale[i] = math.sqrt(scale[i])
+					break
 
-						basecolor = (light.intensity * 255 / (100 * 100)) * (txdata.width * txdata.height / (scale[0] * scale[1] * poly.area))
+				if not matched:
+					order.walk()
 
-						# Here's few variations of code where all produce different results
-						# the one currently used is the most consistent one that produces 100% match to the original
-						"""rgb = light.intensity.normalize_toscale()
-						realrgb = ((rgb / 255) ** (1 / 2.2)) * 255
-						foundtextures[texture] = [realrgb, round(max(basecolor) / max(rgb))]"""
+		foundsets.append(foundtextures)
 
-						"""clr = light.intensity.normalize() ** (1 / 2.2)
-						newclr = clr
-						if max(clr) > 1.0:
-							newclr = newclr.scale(1 / max(clr))
-						foundtextures[texture] = [newclr.scale(255).scale(((round(max(basecolor) / max(rgb)) ** 0.85) * 0.002) + 1), round(max(basecolor) / max(rgb))]"""
-						
-						realrgb = ((basecolor / 255) ** (1 / 2.2)) * 255
-						realrgb = Vector(*[round(x) for x in realrgb])
-						foundtextures[texture] = [realrgb]
+	if stats is not None:
+		stats.count("chunks", len(tasks))
+		stats.count("patches", patches)
+		stats.count("close_enough calls", tests)
+		if groups is not None:
+			stats.count("match fallbacks", fallbacks)
 
-						lights.remove(light)
-						shapes.remove((shape, faceidx))
+	return foundsets
+
+
+def extract(path):
+	""" Extracts lights.rad information from a single map, returns a result dict or a dict with an error message """
+	starttime = time.perf_counter()
+	stats = Stats()
+
+	# Only the lumps accessed here are decoded, the rest of the map is never read
+	try:
+		print(f"Parsing {path}:")
+		with stats.timer("read"):
+			bsp = BSPFile.open(path)
+
+		with bsp:
+			def decode(index):
+				with stats.timer(f"decode {index.name}"):
+					return bsp.lumps[index].data
+
+			map_revision = bsp.map_revision
+			texinfo = decode(BSPLumps.LUMP_TEXINFO)
+			texdata = decode(BSPLumps.LUMP_TEXDATA)
+			with stats.timer("texture names"):
+				texnames = bsp.texture_names
+			faces = decode(BSPLumps.LUMP_FACES)
+
+			# With numpy the points of the light faces are read from the lumps as arrays, before the map is closed,
+			# the lumps they are made of aren't decoded then
+			edges = surfedges = verts = lightfaces = gathered = None
+			if MapPool is None and not ProcessArgs.on_demand and not ProcessArgs.incremental and ProcessArgs.subdivision_cache <= 0 and batch_subdivision():
+				with stats.timer("gather light faces"):
+					lightfaces = collect_light_faces(faces, texinfo, texnames, edges, surfedges, verts, ProcessArgs.quick_search, stats, points = False)
+					gathered = batchsubdivide.gather_faces([x[0] for x in lightfaces], *[bsp.lumps[x] for x in (BSPLumps.LUMP_FACES, BSPLumps.LUMP_SURFEDGES, BSPLumps.LUMP_EDGES, BSPLumps.LUMP_VERTEXES)])
+			else:
+				edges = decode(BSPLumps.LUMP_EDGES)
+				surfedges = decode(BSPLumps.LUMP_SURFEDGES)
+				verts = decode(BSPLumps.LUMP_VERTEXES)
+
+			worldlights = decode(BSPLumps.LUMP_WORLDLIGHTS)
+			hdrlights = decode(BSPLumps.LUMP_WORLDLIGHTS_HDR) if ProcessArgs.hdr else None
+
+			planes = decode(BSPLumps.LUMP_PLANES) if ProcessArgs.plane_filter else None
+
+			leafs = leaffaces = None
+			if ProcessArgs.match == "cluster":
+				try:
+					leafs = decode(BSPLumps.LUMP_LEAFS)
+					leaffaces = decode(BSPLumps.LUMP_LEAFFACES)
+				except Exception as e:
+					print(f"{e}, matching lights geometrically...")
+
+			hashes = None
+			if ProcessArgs.incremental and MapPool is None and not ProcessArgs.on_demand:
+				with stats.timer("hash lumps"):
+					hashes = {x: PatchStore.lump_hash(bsp.lumps[BSPLumps[x]]) for x in PatchStore.lumps}
+
+			geometry = None
+			if MapPool is not None and not ProcessArgs.on_demand:
+				with stats.timer("share geometry"):
+					geometry = SharedGeometry.create(*[bsp.lumps[x] for x in (BSPLumps.LUMP_VERTEXES, BSPLumps.LUMP_EDGES, BSPLumps.LUMP_SURFEDGES)])
+
+			# Only the lumps that were used are counted as unresolved, no matter what they were read by
+			stats.count("unresolved lumps", len([x for x in bsp.lumps if x.estimated and x.used]))
+	except Exception as e:
+		print(f"{e}, skipping...")
+		return {"path": path, "error": str(e)}
+
+	# HDR lights are matched against the same patches as the LDR ones
+	lightsets = [list(worldlights)]
+	if hdrlights is not None:
+		lightsets.append(list(hdrlights))
+
+	if geometry is not None:
+		try:
+			with stats.timer("collect"):
+				lightfaces = collect_light_faces(faces, texinfo, texnames, edges, surfedges, verts, ProcessArgs.quick_search, stats, points = False)
+
+			with stats.timer("match"):
+				grouping = lambda x: match_groups(x, faces, leafs, leaffaces)
+				foundsets = match_lights_parallel(lightfaces, lightsets, faces, texinfo, texdata, texnames, ProcessArgs.search_distance, geometry, grouping, stats)
+		finally:
+			geometry.close()
+			geometry.unlink()
+	elif ProcessArgs.on_demand:
+		# Faces are subdivided while matching, only the ones lights fall close to
+		with stats.timer("collect"):
+			lightfaces = collect_light_faces(faces, texinfo, texnames, edges, surfedges, verts, ProcessArgs.quick_search, stats)
+
+		with stats.timer("match"):
+			groups, light_group = match_groups([x[0] for x in lightfaces], faces, leafs, leaffaces)
+			subdivided = dict()
+			foundsets = [match_lights_on_demand(lightfaces, lights, faces, texinfo, texdata, texnames, ProcessArgs.search_distance, groups, light_group, stats, subdivided) for lights in lightsets]
+	else:
+		with stats.timer("subdivide"):
+			collect = lambda: collect_light_faces(faces, texinfo, texnames, edges, surfedges, verts, ProcessArgs.quick_search, stats)
+			if gathered is not None:
+				shapes = subdivide_gathered(lightfaces, *gathered)
+			else:
+				shapes = subdivide(collect()) if hashes is None else subdivide_incremental(path, hashes, collect, stats)
+		stats.count("patches", sum([len(x[0].polys) for x in shapes]))
+
+		with stats.timer("match"):
+			groups, light_group = match_groups([x[1] for x in shapes], faces, leafs, leaffaces)
+			foundsets = [match_lights(shapes, lights, faces, texinfo, texdata, texnames, ProcessArgs.search_distance, groups, light_group, planes, stats) for lights in lightsets]
+
+	stats.timings["total"] = time.perf_counter() - starttime
+
+	result = {"path": path, "map_revision": map_revision}
+	for (prefix, name), alllights, lights, foundtextures in zip((("", "lights"), ("hdr_", "HDR lights")), (worldlights, hdrlights), lightsets, foundsets):
+		unmatched = [x for x in lights if x.type == EmitType.emit_surface]
+		stats.count(f"{name} matched", len([x for x in alllights if x.type == EmitType.emit_surface]) - len(unmatched))
+		stats.count(f"{name} unmatched", len(unmatched))
+
+		result[f"{prefix}textures"] = {key: list(value[0]) for key, value in foundtextures.items()}
+		result[f"unmatched_{prefix}lights"] = [{"origin": list(x.origin), "texinfo": x.texinfo} for x in unmatched]
+
+	result["timings"] = stats.timings
+	result["counters"] = stats.counters
+
+	return result
+
+
+def write_rad(path, foundtextures, hdrtextures = None):
+	""" Writes found textures (texture -> rgb) and HDR ones to the .rad file next to the map """
+	textures = dict(foundtextures)
+	for key, value in (hdrtextures or dict()).items():
+		textures[key] = [*textures.get(key, value), 255, *value, 255]
+
+	if len(textures) > 0:
+		with open(rad_path(path), "w") as out:
+			print(f"Found {len(textures)} textures:")
+			for key, value in textures.items():
+				msg = f"{key.lower()} {' '.join([str(x) for x in value])}"
+				print(f"{msg}")
+				out.write(f"{msg}\n")
+	else:
+		print(f"No light.rad textures were found!")
+
+
+def rad_path(path):
+	return os.path.join(os.path.dirname(path), f"lights_{os.path.splitext(os.path.basename(path))[0]}.rad")
 
-						break
 
-		if len(foundtextures) > 0:
-			with open(os.path.join(os.path.dirname(path), f"lights_{os.path.splitext(os.path.basename(path))[0]}.rad"), "w") as out:
-				print(f"Found {len(foundtextures)} textures:")
-				for key, value in foundtextures.items():
-					msg = f"{key.lower()} {' '.join([str(x) for x in value[0]])}"
-					print(f"{msg}")
-					out.write(f"{msg}\n")
+def to_record(result):
+	""" Converts extract() result to a record printed in ndjson format """
+	if "error" in result:
+		return result
+
+	record = {**result, "textures": {key.lower(): value for key, value in result["textures"].items()}}
+	if "hdr_textures" in result:
+		record["hdr_textures"] = {key.lower(): value for key, value in result["hdr_textures"].items()}
+
+	return record
+
+
+def disable_cache(e):
+	""" Reports that the cache can't be used, the rest of the maps are extracted without it """
+	global Cache, Patches
+
+	print(f"Failed to use the cache at {ProcessArgs.cache_path} ({e}), extracting without it.", file = sys.stderr)
+	Cache = None
+	Patches = None
+	ProcessArgs.no_cache = True
+	ProcessArgs.incremental = False
+
+
+def extract_cached(path):
+	""" Same as extract(), but results are looked up in and stored to the result cache, unless it's disabled """
+	global Cache
+
+	if ProcessArgs.no_cache:
+		return extract(path)
+
+	try:
+		# Opened on the first use, so every worker process has its own connection
+		if Cache is None:
+			Cache = ResultCache(ProcessArgs.cache_path, ProcessArgs.cache_size * 1024 * 1024)
+	except (OSError, sqlite3.Error) as e:
+		disable_cache(e)
+		return extract(path)
+
+	try:
+		key = Cache.key(path, __version__, ProcessArgs.quick_search, ProcessArgs.search_distance, ProcessArgs.match, ProcessArgs.hdr)
+	except OSError:
+		# Map can't be read, extract() reports it
+		return extract(path)
+
+	try:
+		result = Cache.get(key)
+	except sqlite3.Error as e:
+		disable_cache(e)
+		return extract(path)
+
+	if result is not None:
+		print(f"Using cached result for {path}:")
+		return {**result, "path": path, "cached": True}
+
+	result = extract(path)
+
+	# Timings and counters only describe the extraction that produced the result
+	if "error" not in result and Cache is not None:
+		try:
+			Cache.put(key, {key: value for key, value in result.items() if key not in ("timings", "counters")})
+		except sqlite3.Error as e:
+			disable_cache(e)
+
+	return result
+
+
+def extract_record(path):
+	""" Extracts a single map and writes its .rad file, returns the ndjson record, everything else goes to stderr """
+	with contextlib.redirect_stdout(sys.stderr):
+		if not os.path.exists(path):
+			print(f"No file were found under {path} path, skipping...")
+			result = {"path": path, "error": "No file were found"}
 		else:
-			print(f"No light.rad textures were found!")
+			result = extract_cached(path)
+			if "error" not in result:
+				write(path, result)
+
+	return to_record(result)
+
+
+def process(path):
+	if ProcessArgs.format == "ndjson":
+		print(json.dumps(extract_record(path)), flush = True)
+		return
+
+	if not os.path.exists(path):
+		print(f"No file were found under {path} path, skipping...")
+		return
+
+	result = extract_cached(path)
+
+	if "error" not in result:
+		write(path, result)
+
+
+def write(path, result):
+	""" Writes the .rad file of the extract() result, adds the time it took to its timings and reports them with --stats """
+	starttime = time.perf_counter()
+	write_rad(path, result["textures"], result.get("hdr_textures"))
+	result.setdefault("timings", dict())["write"] = time.perf_counter() - starttime
+
+	if ProcessArgs.stats:
+		for line in Stats.report(path, result["timings"], result.get("counters", dict())):
+			print(line)
+
+
+def process_captured(path):
+	""" Same as process(), but everything that was printed is returned instead, used by the worker processes """
+	with io.StringIO() as output:
+		with contextlib.redirect_stdout(output):
+			process(path)
+		return output.getvalue()
+
+
+def serve(requests, respond):
+	""" Extracts a map for every line of requests, responds with its ndjson record per line """
+	for line in requests:
+		path = line.strip()
+		if not path:
+			continue
+
+		try:
+			record = extract_record(path)
+		except Exception as e:
+			print(f"{e}, skipping...", file = sys.stderr)
+			record = {"path": path, "error": str(e)}
+
+		respond(json.dumps(record) + "\n")
+
+
+class ServiceHandler(socketserver.StreamRequestHandler):
+	""" Serves the requests of a single connection to the --socket, connections are served one by one """
+
+	def handle(self):
+		serve((x.decode("utf-8") for x in self.rfile), lambda x: self.wfile.write(x.encode("utf-8")))
+
+
+def serve_socket(path):
+	assert hasattr(socketserver, "UnixStreamServer"), "Unix sockets aren't supported on this platform!"
+
+	# Socket left behind by a service that wasn't shut down properly
+	if os.path.exists(path):
+		assert stat.S_ISSOCK(os.stat(path).st_mode), f"{path} already exists and isn't a socket!"
+		os.remove(path)
+
+	with socketserver.UnixStreamServer(path, ServiceHandler) as server:
+		print(f"Serving on {path}...", file = sys.stderr)
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			os.remove(path)
+
+
+def watch(directory):
+	""" Extracts the maps that appear or change in the directory once they are completely written, forever """
+	with DirectoryWatcher(directory, ProcessArgs.watch_settle) as watcher:
+		for path in sorted(watcher.reported):
+			if not os.path.exists(rad_path(path)) or os.path.getmtime(rad_path(path)) < os.path.getmtime(path):
+				watcher.request(path)
+
+		print(f"Watching {directory} for maps ({watcher.backend})...", file = sys.stderr)
+		try:
+			for path in watcher:
+				try:
+					process(path)
+				except Exception as e:
+					print(f"{e}, skipping {path}...", file = sys.stderr)
+		except KeyboardInterrupt:
+			pass
+
+
+def init_worker(args):
+	global ProcessArgs
+	ProcessArgs = args
+
+
+def main():
+	global MapPool
+
+	starttime = time.time()
+
+	if ProcessArgs.jobs > 1 and len(ProcessArgs.filepath) > 1 and not (ProcessArgs.serve or ProcessArgs.socket_path or ProcessArgs.watch):
+		# Maps are processed by a pool of workers, results are printed in the same order as maps were passed,
+		# each one as soon as it and all of the maps before it are done
+		with multiprocessing.Pool(min(ProcessArgs.jobs, len(ProcessArgs.filepath)), initializer = init_worker, initargs = (ProcessArgs,), maxtasksperchild = ProcessArgs.recycle or None) as pool:
+			for output in pool.imap(process_captured, ProcessArgs.filepath):
+				print(output, end = "", flush = True)
+	else:
+		# Processes that split the work on a single map between them, shared by all of the maps
+		with contextlib.ExitStack() as stack:
+			if ProcessArgs.map_jobs > 1 and not ProcessArgs.on_demand:
+				MapPool = stack.enter_context(multiprocessing.Pool(ProcessArgs.map_jobs, initializer = init_worker, initargs = (ProcessArgs,)))
+
+			if ProcessArgs.watch:
+				watch(ProcessArgs.watch)
+			elif ProcessArgs.socket_path:
+				serve_socket(ProcessArgs.socket_path)
+			elif ProcessArgs.serve:
+				serve(sys.stdin, lambda x: print(x, end = "", flush = True))
+			else:
+				for path in ProcessArgs.filepath:
+					process(path)
+
+	if ProcessArgs.format == "ndjson" or ProcessArgs.serve or ProcessArgs.socket_path or ProcessArgs.watch:
+		return
 
 	input(f"Program finished in {time.time() - starttime:.3f} seconds. Press ENTER to exit...")
 
 
 if __name__ == "__main__":
+	multiprocessing.freeze_support()
+
 	parser = ArgumentParser(description = 'Extracts lights.rad information from a Source 1 Engine maps.', formatter_class = ArgumentDefaultsHelpFormatter)
 	parser.add_argument('-q', '--quick_search',
 			help = 'Performs quick search, faster but might not find everything;',
@@ -132,9 +1058,72 @@ if __name__ == "__main__":
 	parser.add_argument('-d', '--distance',
 			help = 'Distance to search for the light in units, increasing it might help searching for textures with quick_search enabled. (bhop_bludi (CSS) with quick search, needs this set to 5 to find the texture for example);',
 			action = 'store', type = int, default = 1, dest = 'search_distance')
-	parser.add_argument('-v', '--version', action = 'version', version = 'LightsRadExtractor 1.0.0')
-	parser.add_argument('filepath', help = 'Paths to bsp file;', nargs = '+')
+	parser.add_argument('-m', '--match',
+			help = 'How surface lights are matched to the light faces, geometric tests every light against the patches of all light faces around it, texinfo only against the faces with the same texinfo as the light, cluster only against the faces in the visibility cluster of the light. Both fall back to geometric if no light face has the texinfo or is in the cluster;',
+			action = 'store', choices = ('geometric', 'texinfo', 'cluster'), default = 'geometric', dest = 'match')
+	parser.add_argument('--hdr',
+			help = 'Also matches the HDR surface lights (LUMP_WORLDLIGHTS_HDR) against the same patches, textures found with them get HDR values in the .rad file;',
+			action = 'store_true', default = False, dest = 'hdr')
+	parser.add_argument('-p', '--plane_filter',
+			help = 'Buckets light faces by their planes and skips whole buckets which planes are too far from a light, before any of their patches is tested. Results are the same;',
+			action = 'store_true', default = False, dest = 'plane_filter')
+	parser.add_argument('--on_demand',
+			help = 'Keeps only the bounding boxes of the light faces and subdivides a face once a light falls close to its box, or once the order the faces are tested in depends on whether it subdivides. Results are the same, plane_filter is not used with it;',
+			action = 'store_true', default = False, dest = 'on_demand')
+	parser.add_argument('-j', '--jobs',
+			help = 'Amount of processes to extract multiple maps in parallel with;',
+			action = 'store', type = int, default = 1, dest = 'jobs')
+	parser.add_argument('--map_jobs',
+			help = 'Amount of processes to subdivide the light faces of a single map and match its lights with, used when maps are extracted one by one. The points of the faces are shared with them through shared memory, results are the same. Not used with on_demand;',
+			action = 'store', type = int, default = 1, dest = 'map_jobs')
+	parser.add_argument('--recycle',
+			help = 'Amount of maps a process extracts before it gets replaced by a new one when running with multiple jobs, 0 to never replace them;',
+			action = 'store', type = int, default = 16, dest = 'recycle')
+	parser.add_argument('-f', '--format',
+			help = 'Output format, ndjson prints one json record per map as soon as it is done and never waits for input, the rest of the output goes to stderr;',
+			action = 'store', choices = ('text', 'ndjson'), default = 'text', dest = 'format')
+	parser.add_argument('--no-cache',
+			help = 'Always extracts maps, without looking up or storing the results in the result cache;',
+			action = 'store_true', default = False, dest = 'no_cache')
+	parser.add_argument('--cache',
+			help = 'Path to the result cache database;',
+			action = 'store', default = ResultCache.default_path(), dest = 'cache_path')
+	parser.add_argument('--cache_size',
+			help = 'Maximum size of the result cache in megabytes, shared by the results and the patches stored with incremental, least recently used ones are evicted first;',
+			action = 'store', type = int, default = 64, dest = 'cache_size')
+	parser.add_argument('--subdivision',
+			help = 'Subdivision engine, numpy subdivides all of the light faces of a map at once, auto picks it if numpy is installed. Both produce the same patches;',
+			action = 'store', choices = ('auto', 'python', 'numpy'), default = 'auto', dest = 'subdivision')
+	parser.add_argument('--subdivision_cache',
+			help = 'Amount of distinct light faces to keep subdivided, faces that only differ by their position are subdivided once. Points of their patches might differ from the ones of the faces subdivided on their own by rounding, which might change the results. 0 to subdivide every face on its own;',
+			action = 'store', type = int, default = 0, dest = 'subdivision_cache')
+	parser.add_argument('--incremental',
+			help = 'Stores the light faces and patches of every map next to the result cache and reuses them when the map is extracted again, all of them if none of the lumps they are made of has changed, or the ones of the faces that have not moved or changed otherwise. Results are the same, not used with on_demand or map_jobs;',
+			action = 'store_true', default = False, dest = 'incremental')
+	parser.add_argument('--stats',
+			help = 'Reports time spent on every stage and counters of the work done for every map, cached results only report writing;',
+			action = 'store_true', default = False, dest = 'stats')
+	parser.add_argument('--serve',
+			help = 'Keeps running and extracts the maps which paths are read from stdin line by line, responds with a json record per map on stdout. Caches are kept warm between the maps, the filepath is not used;',
+			action = 'store_true', default = False, dest = 'serve')
+	parser.add_argument('--socket',
+			help = 'Same as serve, but the paths are read from the connections to a local Unix socket created at this path, records are sent back over the same connection;',
+			action = 'store', default = None, dest = 'socket_path')
+	parser.add_argument('--watch',
+			help = 'Keeps running and extracts the maps that appear or change in this directory, writing the .rad file next to each one. Maps that are already there are extracted if their .rad file is missing or older than the map, the filepath is not used. Works best with incremental;',
+			action = 'store', default = None, dest = 'watch')
+	parser.add_argument('--watch_settle',
+			help = 'Seconds a map in the watched directory has to stay unchanged before it is extracted, so maps that are still being written are not picked up;',
+			action = 'store', type = float, default = 2.0, dest = 'watch_settle')
+	parser.add_argument('-v', '--version', action = 'version', version = f'LightsRadExtractor {__version__}')
+	parser.add_argument('filepath', help = 'Paths to bsp file;', nargs = '*')
 	
 	ProcessArgs = parser.parse_args()
 
+	if len(ProcessArgs.filepath) == 0 and not (ProcessArgs.serve or ProcessArgs.socket_path or ProcessArgs.watch):
+		parser.error("the following arguments are required: filepath")
+
+	if ProcessArgs.subdivision == "numpy" and not batchsubdivide.available():
+		parser.error("argument --subdivision: numpy is not installed, use auto or python instead")
+
 	main()
\ No newline at end of file
@@ -1,66 +1,134 @@
-from vector import Vector
+import math
+from collections import OrderedDict
+from vector import Vector3
 
 
 maxchop = 4
 minchop = 4
 
 class Polygon:
-	def __init__(self, _points: list, _chop = maxchop, _normal = Vector(0, 0, 0)):
+	""" Polygon with its normal, bounds, area and center calculated on the first access only """
+
+	def __init__(self, _points: list, _chop = maxchop, _normal = None):
 		assert len(_points) >= 3, f"Wrong polygon being constructed. ({len(_points)} < 3)"
 		self.points = _points
-
-		self.normal = _normal
-		if self.normal == Vector(0, 0, 0):
-			self.calc_normal()
-
-		self.mins = Vector(0, 0, 0)
-		self.maxs = Vector(0, 0, 0)
-		self.calc_bounds()
-
 		self.chop = _chop
 
-		self.area = 0
-		self.center = Vector(0, 0, 0)
-		self.calc_area_and_center()
+		self.__normal = _normal
+		self.__mins = None
+		self.__maxs = None
+		self.__area = None
+		self.__center = None
+
+	@classmethod
+	def fromcomputed(cls, _points: list, _normal, _mins, _maxs, _area, _center, _chop = maxchop):
+		""" Constructs a polygon out of already calculated attributes, skipping all of the calculations """
+		poly = cls.__new__(cls)
+		poly.points = _points
+		poly.chop = _chop
+		poly.__normal = _normal
+		poly.__mins = _mins
+		poly.__maxs = _maxs
+		poly.__area = _area
+		poly.__center = _center
+		return poly
+
+	@property
+	def normal(self):
+		if self.__normal is None:
+			self.calc_normal()
+		return self.__normal
+
+	@property
+	def mins(self):
+		if self.__mins is None:
+			self.calc_bounds()
+		return self.__mins
+
+	@property
+	def maxs(self):
+		if self.__maxs is None:
+			self.calc_bounds()
+		return self.__maxs
+
+	@property
+	def area(self):
+		if self.__area is None:
+			self.calc_area_and_center()
+		return self.__area
+
+	@property
+	def center(self):
+		if self.__center is None:
+			self.calc_area_and_center()
+		return self.__center
 
 	def calc_normal(self):
-		norm = Vector(0, 0, 0)
-		numverts = len(self.points)
+		nx = ny = nz = 0
 
-		for i in range(numverts):
-			norm = norm + Vector(*[
-				(self.points[i].y - self.points[(i + 1) % numverts].y) * (self.points[i].z + self.points[(i + 1) % numverts].z),
-				(self.points[i].z - self.points[(i + 1) % numverts].z) * (self.points[i].x + self.points[(i + 1) % numverts].x),
-				(self.points[i].x - self.points[(i + 1) % numverts].x) * (self.points[i].y + self.points[(i + 1) % numverts].y)
-			])
+		for p0, p1 in zip(self.points, self.points[1:] + self.points[:1]):
+			nx = nx + (p0.y - p1.y) * (p0.z + p1.z)
+			ny = ny + (p0.z - p1.z) * (p0.x + p1.x)
+			nz = nz + (p0.x - p1.x) * (p0.y + p1.y)
 
-		self.normal = -norm.normalize()
+		self.__normal = -Vector3(nx, ny, nz).normalize()
 
 	def calc_bounds(self):
-		self.mins = Vector(*self.points[0])
-		self.maxs = Vector(*self.points[0])
-		for point in self.points[0:]:
-			for i in range(3):
-				if point[i] < self.mins[i]:
-					self.mins[i] = point[i]
-				if point[i] > self.maxs[i]:
-					self.maxs[i] = point[i]
+		minx = maxx = self.points[0].x
+		miny = maxy = self.points[0].y
+		minz = maxz = self.points[0].z
+
+		for point in self.points:
+			if point.x < minx:
+				minx = point.x
+			elif point.x > maxx:
+				maxx = point.x
+			if point.y < miny:
+				miny = point.y
+			elif point.y > maxy:
+				maxy = point.y
+			if point.z < minz:
+				minz = point.z
+			elif point.z > maxz:
+				maxz = point.z
+
+		self.__mins = Vector3(minx, miny, minz)
+		self.__maxs = Vector3(maxx, maxy, maxz)
 
 	def calc_area_and_center(self):
 		total = 0
-		for p0, p1, p2 in self.iter_as_tris():
-			area = (p1 - p0).cross(p2 - p1).length()
+		cx = cy = cz = 0
+		p0 = self.points[0]
+
+		for i in range(1, len(self.points) - 1):
+			p1 = self.points[i]
+			p2 = self.points[i + 1]
+
+			# (p1 - p0) x (p2 - p1)
+			ax, ay, az = p1.x - p0.x, p1.y - p0.y, p1.z - p0.z
+			bx, by, bz = p2.x - p1.x, p2.y - p1.y, p2.z - p1.z
+			x = ay * bz - by * az
+			y = az * bx - bz * ax
+			z = ax * by - bx * ay
+
+			area = math.sqrt(x * x + y * y + z * z)
 			total = total + area
-			self.center = self.center.extend(p1, area / 3).extend(p2, area / 3).extend(p0, area / 3)
+			third = area / 3
+			cx = cx + p1.x * third + p2.x * third + p0.x * third
+			cy = cy + p1.y * third + p2.y * third + p0.y * third
+			cz = cz + p1.z * third + p2.z * third + p0.z * third
 
 		if total != 0:
-			self.center = self.center.scale(1 / total)
+			scale = 1 / total
+			cx, cy, cz = cx * scale, cy * scale, cz * scale
 
-		self.area = total * 0.5
+		self.__center = Vector3(cx, cy, cz)
+		self.__area = total * 0.5
 
-		assert self.area > 0, "Zero area child patch!!!!"
+		assert self.__area > 0, "Zero area child patch!!!!"
 
-	def subdivide(self, luxscale, subpatches_list):
+	def split_axis(self, luxscale):
+		""" Returns the axis the polygon has to be split along, or -1 if it's small enough already """
 		widest = -1
 		widest_axis = -1
 		subdiv = False
@@ -80,19 +148,34 @@ class Polygon:
 					subdiv = True
 					self.chop = max([minchop, self.chop / 2])
 
-		if not subdiv:
-			subpatches_list.append(self)
-			return None
+		return widest_axis if subdiv else -1
+
+	def subdivide(self, luxscale, subpatches_list):
+		""" Splits the polygon in halves along its widest axis until every piece is small enough, depth first """
+		clipper = AxisClipper(0.1)
+		stack = [self]
+
+		while stack:
+			poly = stack.pop()
+			axis = poly.split_axis(luxscale)
+
+			if axis == -1:
+				# Only the patches are checked for having an area, the pieces that are split further are never used
+				poly.calc_area_and_center()
+				subpatches_list.append(poly)
+				continue
 
-		split = Vector(0, 0, 0)
-		split[widest_axis] = 1
-		dist = (self.mins[widest_axis] + self.maxs[widest_axis]) * 0.5
-		o1, o2 = self.clip_epsilon(split, dist, 0.1)
+			f, b = clipper.clip(poly.points, axis, (poly.mins[axis] + poly.maxs[axis]) * 0.5)
+			assert f is not None and b is not None, "Subdivision of the face doesn't converge or exceeds maximum points of a polygon!"
 
-		if o1 is not None:
-			o1.subdivide(luxscale, subpatches_list)
-		if o2 is not None:
-			o2.subdivide(luxscale, subpatches_list)
+			o1 = Polygon(f, _normal = poly.normal) if len(f) >= 3 else None
+			o2 = Polygon(b, _normal = poly.normal) if len(b) >= 3 else None
+			assert o1 is not None or o2 is not None, "Some logic issue, this code shouldn't be triggered!"
+
+			if o2 is not None:
+				stack.append(o2)
+			if o1 is not None:
+				stack.append(o1)
 
 		return subpatches_list
 
@@ -123,25 +206,26 @@ class Polygon:
 
 		f = []
 		b = []
-		mid = Vector(0, 0, 0)
 
+		# Points are never modified in place, so they are shared between the polygons
 		for i, point in enumerate(self.points):
 			if sides[i] == 2:
-				f.append(Vector(*point))
-				b.append(Vector(*point))
+				f.append(point)
+				b.append(point)
 				continue
 
 			if sides[i] == 0:
-				f.append(Vector(*point))
+				f.append(point)
 
 			if sides[i] == 1:
-				b.append(Vector(*point))
+				b.append(point)
 
 			if sides[i + 1] == 2 or sides[i + 1] == sides[i]:
 				continue
 
 			p2 = self.points[(i + 1) % len(self.points)]
 			dot = dists[i] / (dists[i] - dists[i + 1])
+			mid = Vector3(0, 0, 0)
 			for j in range(3):
 				if normal[j] == 1:
 					mid[j] = dist
@@ -150,8 +234,8 @@ class Polygon:
 				else:
 					mid[j] = point[j] + dot * (p2[j] - point[j])
 
-			f.append(Vector(*mid))
-			b.append(Vector(*mid))
+			f.append(mid)
+			b.append(mid)
 
 		assert len(f) <= len(self.points) + 4 and len(b) <= len(self.points) + 4, "Maximum points exceeded on clip epsilon. Probably some logic issue!"
 		assert len(f) <= 64 and len(b) <= 64, "Maximum points exceeded on clip epsilon. Probably some logic issue!"
@@ -165,6 +249,10 @@ class Polygon:
 
 		assert False, "Some logic issue, this code shouldn't be triggered!"
 
+	def translated(self, offset):
+		""" Returns a copy of the polygon moved by offset """
+		return Polygon([x + offset for x in self.points], self.chop, self.normal)
+
 	def is_intersect(self, l1, l2):
 		for p0, p1, p2 in self.iter_as_tris():
 			p01 = p1 - p0
@@ -188,10 +276,83 @@ class Polygon:
 	def __repr__(self):
 		return "<{0}: [\n\t{1}\n]>".format(
 			self.__class__.__name__,
-			",\n\t".join("{} = {!r}".format(k, v).replace("\n", "\n\t") for k, v in self.__dict__.items())
+			",\n\t".join("{} = {!r}".format(k.replace(f"_{Polygon.__name__}__", ""), v).replace("\n", "\n\t") for k, v in self.__dict__.items())
 		)
 
 
+class AxisClipper:
+	""" Polygon.clip_epsilon() for the axis aligned planes used by Polygon.subdivide() """
+
+	def __init__(self, epsilon):
+		self.epsilon = epsilon
+		self.sides = [0] * 68
+		self.dists = [0.0] * 68
+
+	def clip(self, points, axis, dist):
+		""" Returns front and back point lists, or None in place of both if the plane doesn't cross the polygon """
+		sides = self.sides
+		dists = self.dists
+		epsilon = self.epsilon
+		front = back = 0
+
+		for i, point in enumerate(points):
+			dot = (point.x if axis == 0 else point.y if axis == 1 else point.z) - dist
+			dists[i] = dot
+			if dot > epsilon:
+				sides[i] = 0
+				front = front + 1
+			elif dot < -epsilon:
+				sides[i] = 1
+				back = back + 1
+			else:
+				sides[i] = 2
+
+		numpoints = len(points)
+		sides[numpoints] = sides[0]
+		dists[numpoints] = dists[0]
+
+		# Same as clip_epsilon() returning the polygon itself, splitting it again would never end
+		if front == 0 or back == 0:
+			return None, None
+
+		f = []
+		b = []
+
+		for i, point in enumerate(points):
+			side = sides[i]
+			if side == 2:
+				f.append(point)
+				b.append(point)
+				continue
+
+			if side == 0:
+				f.append(point)
+			else:
+				b.append(point)
+
+			nextside = sides[i + 1]
+			if nextside == 2 or nextside == side:
+				continue
+
+			p2 = points[i + 1] if i + 1 < numpoints else points[0]
+			dot = dists[i] / (dists[i] - dists[i + 1])
+
+			if axis == 0:
+				mid = Vector3(dist, point.y + dot * (p2.y - point.y), point.z + dot * (p2.z - point.z))
+			elif axis == 1:
+				mid = Vector3(point.x + dot * (p2.x - point.x), dist, point.z + dot * (p2.z - point.z))
+			else:
+				mid = Vector3(point.x + dot * (p2.x - point.x), point.y + dot * (p2.y - point.y), dist)
+
+			f.append(mid)
+			b.append(mid)
+
+		assert len(f) <= numpoints + 4 and len(b) <= numpoints + 4, "Maximum points exceeded on clip epsilon. Probably some logic issue!"
+		assert len(f) <= 64 and len(b) <= 64, "Maximum points exceeded on clip epsilon. Probably some logic issue!"
+
+		return f, b
+
+
 class Shape:
 	def __init__(self, _polys: list):
 		self.polys = _polys
@@ -218,6 +379,21 @@ class Shape:
 		poly.subdivide(luxscale, patches)
 		return cls(patches)
 
+	def translated(self, offset):
+		return Shape([x.translated(offset) for x in self.polys])
+
+	def tolist(self):
+		""" Normal and points of every patch as a flat list of floats, enough for translated() of the fromlist() shape """
+		return [[c for x in [poly.normal, *poly.points] for c in (x.x, x.y, x.z)] for poly in self.polys]
+
+	@classmethod
+	def fromlist(cls, data):
+		polys = []
+		for values in data:
+			points = [Vector3(*values[i:i + 3]) for i in range(0, len(values), 3)]
+			polys.append(Polygon(points[1:], maxchop, points[0]))
+		return cls(polys)
+
 	def is_inside(self, point):
 		dest = self.polys[0].points[0].extend(-self.polys[0].normal, 30)
 		intersections = 0
@@ -238,4 +414,263 @@ class Shape:
 				return poly
 
 	def __repr__(self):
-		return "<{0}: [\n\t{1}\n]>".format(self.__class__.__name__, "\n\t".join([str(x) for x in self.polys]))
\ No newline at end of file
+		return "<{0}: [\n\t{1}\n]>".format(self.__class__.__name__, "\n\t".join([str(x) for x in self.polys]))
+
+class SubdivisionCache:
+	""" Least recently used cache of the shapes of the faces, keyed by their points relative to the first one and the luxel scale """
+
+	def __init__(self, maxsize):
+		assert maxsize > 0, f"Wrong subdivision cache size ({maxsize} <= 0)"
+		self.maxsize = maxsize
+		self.entries = OrderedDict()
+
+	@staticmethod
+	def normalize(points):
+		""" Returns the origin and the points relative to it """
+		origin = points[0] if len(points) > 0 else Vector3(0, 0, 0)
+		return origin, [x - origin for x in points]
+
+	@staticmethod
+	def key(points, luxscale):
+		return (tuple([(x.x, x.y, x.z) for x in points]), luxscale)
+
+	def get(self, key, origin):
+		""" Returns the cached shape moved to origin, the exception the subdivision has failed with, or None """
+		result = self.relative(key)
+		if result is None or isinstance(result, Exception):
+			return result
+		return result.translated(origin)
+
+	def relative(self, key):
+		""" Same as get(), but the shape is left relative to the first point of the face """
+		result = self.entries.get(key)
+		if result is not None:
+			self.entries.move_to_end(key)
+		return result
+
+	def put(self, key, result):
+		self.entries[key] = result
+		self.entries.move_to_end(key)
+
+		while len(self.entries) > self.maxsize:
+			self.entries.popitem(last = False)
+
+
+class PatchGrid:
+	""" Uniform grid over the patch centers of the shapes, query() returns the same patches close_enough() accepts """
+
+	def __init__(self, cellsize):
+		assert cellsize > 0, f"Wrong grid cell size ({cellsize} <= 0)"
+		self.cellsize = cellsize
+		self.cells = {}
+		self.tests = 0
+
+	def add(self, key, shape):
+		for polyidx, poly in enumerate(shape.polys):
+			center = poly.center
+			cell = (
+				math.floor(abs(center.x) / self.cellsize),
+				math.floor(abs(center.y) / self.cellsize),
+				math.floor(abs(center.z) / self.cellsize)
+			)
+
+			if cell in self.cells:
+				self.cells[cell].append((key, polyidx, poly))
+			else:
+				self.cells[cell] = [(key, polyidx, poly)]
+
+	def query(self, point, eps):
+		""" Returns (key, poly) of every patch which center is close enough to the point, ordered by key and patch order """
+		found = self.candidates(point, eps)
+		found.sort(key = lambda x: (x[0], x[1]))
+		return [(key, poly) for key, polyidx, poly in found]
+
+	def candidates(self, point, eps):
+		""" Same as query(), but returns unordered (key, polyidx, poly) """
+		found = []
+		rx = range(math.floor((abs(point.x) - eps) / self.cellsize), math.floor((abs(point.x) + eps) / self.cellsize) + 1)
+		ry = range(math.floor((abs(point.y) - eps) / self.cellsize), math.floor((abs(point.y) + eps) / self.cellsize) + 1)
+		rz = range(math.floor((abs(point.z) - eps) / self.cellsize), math.floor((abs(point.z) + eps) / self.cellsize) + 1)
+
+		for x in rx:
+			for y in ry:
+				for z in rz:
+					cell = self.cells.get((x, y, z))
+					if cell is None:
+						continue
+
+					self.tests = self.tests + len(cell)
+					for key, polyidx, poly in cell:
+						if poly.center.close_enough(point, eps):
+							found.append((key, polyidx, poly))
+
+		return found
+
+
+class PlaneBuckets:
+	""" Patches of the shapes bucketed by the plane of their face, buckets too far from the point are skipped """
+
+	# Points of the faces are only approximately on their planes
+	slack = 1
+
+	def __init__(self, cellsize, planes):
+		assert cellsize > 0, f"Wrong grid cell size ({cellsize} <= 0)"
+		self.cellsize = cellsize
+		self.planes = planes
+		self.buckets = {}
+		self.axial = {}
+		self.nonaxial = []
+		self.rejected = 0
+
+	@property
+	def tests(self):
+		return sum([x.tests for x in self.buckets.values()])
+
+	def plane_key(self, planenum):
+		""" Returns (normal x, y, z, dist) of the plane, or None if it's unusable """
+		if planenum < 0 or planenum >= len(self.planes):
+			return None
+
+		plane = self.planes[planenum]
+		if abs(plane.normal.length() - 1) > 0.001:
+			return None
+
+		return (plane.normal.x, plane.normal.y, plane.normal.z, plane.dist)
+
+	def add(self, key, shape, planenum):
+		plane = self.plane_key(planenum)
+
+		if plane not in self.buckets:
+			self.buckets[plane] = PatchGrid(self.cellsize)
+
+			axis = -1
+			if plane is not None:
+				for i in range(3):
+					if abs(plane[i]) == 1:
+						axis = i
+
+			if axis != -1:
+				self.axial.setdefault((axis, math.floor(abs(plane[3]) / self.cellsize)), []).append(plane)
+			else:
+				self.nonaxial.append(plane)
+
+		self.buckets[plane].add(key, shape)
+
+	def is_near(self, plane, point, eps):
+		if plane is None:
+			return True
+
+		nx, ny, nz, dist = plane
+		x, y, z = nx * point.x, ny * point.y, nz * point.z
+		tolerance = eps * (abs(nx) + abs(ny) + abs(nz)) + self.slack
+
+		for sx in (x, -x):
+			for sy in (y, -y):
+				for sz in (z, -z):
+					if abs(sx + sy + sz - dist) <= tolerance:
+						return True
+		return False
+
+	def query(self, point, eps):
+		""" Same as PatchGrid.query() """
+		near = []
+		tolerance = eps + self.slack
+
+		for axis in range(3):
+			coord = abs(point[axis])
+			for cell in range(math.floor((coord - tolerance) / self.cellsize), math.floor((coord + tolerance) / self.cellsize) + 1):
+				for plane in self.axial.get((axis, cell), ()):
+					if abs(coord - abs(plane[3])) <= tolerance:
+						near.append(plane)
+
+		for plane in self.nonaxial:
+			if self.is_near(plane, point, eps):
+				near.append(plane)
+
+		self.rejected = self.rejected + len(self.buckets) - len(near)
+
+		found = []
+		for plane in near:
+			found.extend(self.buckets[plane].candidates(point, eps))
+
+		found.sort(key = lambda x: (x[0], x[1]))
+		return [(key, poly) for key, polyidx, poly in found]
+
+
+class BoxIndex:
+	""" Uniform grid over the bounding boxes of the faces, to find the ones that might be close enough before subdividing them """
+
+	# Patch centers are calculated from the points of the face and might end up outside of its bounds by a rounding error
+	slack = 0.01
+	maxcells = 512
+
+	def __init__(self, cellsize):
+		assert cellsize > 0, f"Wrong grid cell size ({cellsize} <= 0)"
+		self.cellsize = cellsize
+		self.cells = {}
+		self.boxes = {}
+		self.large = []
+		self.tests = 0
+
+	@staticmethod
+	def abs_range(lo, hi):
+		""" Returns the range of the absolute values of [lo, hi] """
+		if lo <= 0 <= hi:
+			return 0, max(-lo, hi)
+		return min(abs(lo), abs(hi)), max(abs(lo), abs(hi))
+
+	def add(self, key, points):
+		if len(points) == 0:
+			return
+
+		box = [self.abs_range(min([p[i] for p in points]), max([p[i] for p in points])) for i in range(3)]
+		self.boxes[key] = box
+
+		ranges = [range(math.floor(lo / self.cellsize), math.floor(hi / self.cellsize) + 1) for lo, hi in box]
+		if len(ranges[0]) * len(ranges[1]) * len(ranges[2]) > self.maxcells:
+			self.large.append(key)
+			return
+
+		for x in ranges[0]:
+			for y in ranges[1]:
+				for z in ranges[2]:
+					cell = (x, y, z)
+					if cell in self.cells:
+						self.cells[cell].append(key)
+					else:
+						self.cells[cell] = [key]
+
+	def contains(self, key, point, eps):
+		tolerance = eps + self.slack
+		for (lo, hi), coord in zip(self.boxes[key], (point.x, point.y, point.z)):
+			if abs(coord) < lo - tolerance or abs(coord) > hi + tolerance:
+				return False
+		return True
+
+	def query(self, point, eps):
+		""" Returns keys of every box the point is in after it's expanded by eps, sorted """
+		found = set()
+		seen = set()
+		tolerance = eps + self.slack
+		rx = range(math.floor((abs(point.x) - tolerance) / self.cellsize), math.floor((abs(point.x) + tolerance) / self.cellsize) + 1)
+		ry = range(math.floor((abs(point.y) - tolerance) / self.cellsize), math.floor((abs(point.y) + tolerance) / self.cellsize) + 1)
+		rz = range(math.floor((abs(point.z) - tolerance) / self.cellsize), math.floor((abs(point.z) + tolerance) / self.cellsize) + 1)
+
+		for x in rx:
+			for y in ry:
+				for z in rz:
+					for key in self.cells.get((x, y, z), ()):
+						if key in seen:
+							continue
+
+						seen.add(key)
+						self.tests = self.tests + 1
+						if self.contains(key, point, eps):
+							found.add(key)
+
+		for key in self.large:
+			self.tests = self.tests + 1
+			if self.contains(key, point, eps):
+				found.add(key)
+
+		return sorted(found)
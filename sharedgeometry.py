@@ -0,0 +1,78 @@
+import os
+import struct
+from multiprocessing import shared_memory, resource_tracker
+from vector import Vector3
+
+
+class SharedGeometry:
+	""" LUMP_VERTEXES, LUMP_EDGES and LUMP_SURFEDGES of a map in a shared memory block, read by the worker processes """
+
+	vertex = struct.Struct("3f")
+	edge = struct.Struct("2H")
+	surfedge = struct.Struct("i")
+
+	def __init__(self, shm, layout):
+		self.shm = shm
+		# (offset, amount of records) of the vertexes, edges and surfedges in the block
+		self.layout = layout
+
+	@classmethod
+	def create(cls, verts, edges, surfedges):
+		""" Copies the data of the lump_t lumps into a new block, it should be unlink()-ed by its creator """
+		lumps = (verts, edges, surfedges)
+		sizes = (cls.vertex.size, cls.edge.size, cls.surfedge.size)
+		shm = shared_memory.SharedMemory(create = True, size = max(sum([x.length for x in lumps]), 1))
+
+		layout = []
+		offset = 0
+		try:
+			for lump, size in zip(lumps, sizes):
+				with memoryview(lump.source) as view:
+					shm.buf[offset:offset + lump.length] = view[lump.offset:lump.offset + lump.length]
+				layout.append((offset, lump.length // size))
+				offset = offset + lump.length
+		except:
+			shm.close()
+			shm.unlink()
+			raise
+
+		return cls(shm, tuple(layout))
+
+	@classmethod
+	def attach(cls, name, layout):
+		try:
+			shm = shared_memory.SharedMemory(name = name, track = False)
+		except TypeError:
+			# Before python 3.13 every process that attaches to the block tracks it as its own,
+			# and its resource tracker would unlink the block once the process exits.
+			# Blocks are only tracked on posix, elsewhere there's no resource tracker to unregister them from
+			shm = shared_memory.SharedMemory(name = name)
+			if os.name == "posix":
+				resource_tracker.unregister(shm._name, "shared_memory")
+		return cls(shm, layout)
+
+	@property
+	def handle(self):
+		""" Arguments for attach() in the other processes """
+		return (self.shm.name, self.layout)
+
+	def read(self, kind, index):
+		offset, count = self.layout[kind]
+		record = (self.vertex, self.edge, self.surfedge)[kind]
+		assert 0 <= index < count, f"Record {index} is out of the shared lump range ({count})"
+		return record.unpack_from(self.shm.buf, offset + index * record.size)
+
+	def points(self, firstedge, numedges):
+		""" Same points of the face as its surfedges are walked by collect_light_faces() """
+		points = []
+		for i in range(numedges):
+			edgeidx = self.read(2, firstedge + i)[0]
+			v = self.read(1, abs(edgeidx))
+			points.append(Vector3(*self.read(0, v[1 if edgeidx < 0 else 0])))
+		return points
+
+	def close(self):
+		self.shm.close()
+
+	def unlink(self):
+		self.shm.unlink()
@@ -0,0 +1,34 @@
+import time
+import contextlib
+
+
+class Stats:
+	""" Timings (in seconds) of the extraction stages and counters of the work done for a single map """
+
+	def __init__(self):
+		self.timings = dict()
+		self.counters = dict()
+
+	@contextlib.contextmanager
+	def timer(self, name):
+		starttime = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - starttime
+
+	def count(self, name, amount = 1):
+		self.counters[name] = self.counters.get(name, 0) + amount
+
+	@staticmethod
+	def report(path, timings, counters):
+		""" Returns timings and counters of a map formatted as text lines """
+		lines = [f"Stats for {path}:"]
+		width = max([len(x) for x in [*timings.keys(), *counters.keys()]] + [0])
+
+		for name, value in timings.items():
+			lines.append(f"\t{name:<{width}} {value * 1000:10.3f} ms")
+		for name, value in counters.items():
+			lines.append(f"\t{name:<{width}} {value:10}")
+
+		return lines
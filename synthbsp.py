@@ -0,0 +1,217 @@
+import lzma
+import math
+import random
+import struct
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from bsplib import BSPLumps, SURFFlags, EmitType
+from shapes import Polygon, Shape
+from vector import Vector3
+
+
+class SyntheticBSP:
+	""" Builds a version 20/21 .bsp with a configurable amount of faces, light panels, worldlights and textures """
+
+	def __init__(self, version = 21, faces = 1000, light_faces = 100, worldlights = 150, textures = 16, vertices = 0, strings = 0, panel_size = 32, big_panels = 0, seed = 0, hdr = False, hdr_scale = 1.5, degenerate = 0):
+		self.version = version
+		self.num_faces = max(faces, light_faces)
+		self.num_vertices = vertices
+		self.num_strings = strings
+		self.num_light_faces = light_faces
+		self.num_worldlights = worldlights
+		self.num_textures = max(1, textures)
+		self.panel_size = panel_size
+		self.big_panels = min(big_panels, light_faces)
+		self.random = random.Random(seed)
+		self.hdr = hdr
+		self.hdr_scale = hdr_scale
+		self.degenerate = min(degenerate, light_faces)
+
+		self.planes = []
+		self.verts = []
+		self.edges = [(0, 0)]
+		self.surfedges = []
+		self.faces = []
+		self.texinfos = []
+		self.texdatas = []
+		self.strings = bytearray()
+		self.stringtable = []
+		self.lights = []
+		self.hdr_lights = []
+		self.leafs = []
+		self.leaffaces = []
+
+	def add_texture(self, name):
+		self.stringtable.append(len(self.strings))
+		self.strings.extend(name.encode("utf-8") + b"\x00")
+		self.texdatas.append(struct.pack("3f5I", 0.5, 0.5, 0.5, len(self.stringtable) - 1, 128, 128, 128, 128))
+		return len(self.texdatas) - 1
+
+	def add_texinfo(self, texdata, flags, luxscale):
+		self.texinfos.append(struct.pack("16f2I",
+			0.25, 0, 0, 0, 0, 0.25, 0, 0,
+			luxscale, 0, 0, 0, 0, luxscale, 0, 0,
+			flags, texdata))
+		return len(self.texinfos) - 1
+
+	def add_face(self, points, texinfo, normal, dist):
+		self.planes.append(struct.pack("4fi", *normal, dist, 2))
+		firstedge = len(self.surfedges)
+
+		for point in points:
+			self.verts.append(struct.pack("3f", *point))
+
+		first = len(self.verts) - len(points)
+		for i in range(len(points)):
+			self.edges.append((first + i, first + (i + 1) % len(points)))
+			self.surfedges.append(len(self.edges) - 1)
+
+		self.faces.append(struct.pack("H2bi4h4bif5i2HI",
+			len(self.planes) - 1, 0, 0, firstedge, len(points), texinfo, -1, -1,
+			0, -1, -1, -1, -1, 0.0, 0, 0, 0, 0, 0, 0, 0, 0))
+
+	def add_leaf(self, cluster, faces):
+		self.leafs.append(struct.pack("ihH3h3h4Hh2x", 1 if cluster < 0 else 0, cluster, 0, 0, 0, 0, 0, 0, 0, len(self.leaffaces), len(faces), 0, 0, -1))
+		self.leaffaces.extend(faces)
+
+	def add_light(self, origin, intensity, normal, emittype, texinfo, cluster = 0):
+		for lights, scale in ((self.lights, 1), (self.hdr_lights, self.hdr_scale)):
+			values = [*origin, *[x * scale for x in intensity], *normal]
+			if self.version >= 21:
+				values.extend((0, 0, 0))
+			values.extend((cluster, emittype, 0, 0, 0, 0, 0, 0, 0, 0, 0, texinfo, 0))
+			lights.append(struct.pack("12f3I7f3I" if self.version >= 21 else "9f3I7f3I", *values))
+
+	def build(self):
+		light_texinfos = []
+		for i in range(self.num_textures):
+			texdata = self.add_texture(f"synthetic/light_{i:04d}")
+			light_texinfos.append(self.add_texinfo(texdata, SURFFlags.SURF_LIGHT, 1 / 16))
+
+		wall_texinfo = self.add_texinfo(self.add_texture("synthetic/wall"), 0, 1 / 16)
+
+		# Textures that no face uses, only make the string table bigger
+		for i in range(self.num_strings - len(self.stringtable)):
+			self.add_texture(f"synthetic/unused/texture_{i:06d}")
+
+		# Light panels, laid out on a grid on the ceiling and facing down
+		columns = max(1, math.ceil(math.sqrt(self.num_light_faces)))
+		spacing = self.panel_size * 4
+		emitters = []
+		degenerate = set(self.random.sample(range(self.num_light_faces), self.degenerate)) if self.degenerate else set()
+		for i in range(self.num_light_faces):
+			size = self.panel_size * (8 if i < self.big_panels else 1)
+			x = (i % columns) * spacing * (8 if self.big_panels else 1)
+			y = (i // columns) * spacing * (8 if self.big_panels else 1)
+			z = 512.0
+			texinfo = light_texinfos[i % len(light_texinfos)]
+			if i in degenerate:
+				points = [(x, y, z), (x + size, y, z), (x + size * 2, y, z), (x + size * 3, y, z)]
+				self.add_face(points, texinfo, (0.0, 0.0, -1.0), -z)
+				continue
+
+			points = [(x, y, z), (x + size, y, z), (x + size, y + size, z), (x, y + size, z)]
+			self.add_face(points, texinfo, (0.0, 0.0, -1.0), -z)
+			emitters.append((points, texinfo, 1 + i // columns))
+
+		# Walls that are only ever scanned by the extractor
+		for i in range(self.num_faces - self.num_light_faces):
+			x = (i % 256) * 64.0
+			y = -128.0 - (i // 256) * 64.0
+			points = [(x, y, 0.0), (x + 64, y, 0.0), (x + 64, y, 64.0), (x, y, 64.0)]
+			self.add_face(points, wall_texinfo, (0.0, 1.0, 0.0), y)
+
+		# Leaf 0 is the solid one, walls aren't referenced by any leaf
+		self.add_leaf(-1, [])
+		self.add_leaf(0, [])
+		for cluster in range(1, 1 + math.ceil(self.num_light_faces / columns)):
+			self.add_leaf(cluster, list(range((cluster - 1) * columns, min(cluster * columns, self.num_light_faces))))
+
+		# Vertices that no edge uses, faces use 4 vertices each
+		for i in range(self.num_vertices - len(self.verts)):
+			self.verts.append(struct.pack("3f", i * 8.0, -64.0, -64.0))
+
+		# Surface lights sit on one of the patches of the emitting face, the rest are point lights
+		for i in range(self.num_worldlights):
+			if i < len(emitters):
+				points, texinfo, cluster = emitters[i]
+				shape = Shape.subdivide_poly_to_shape(Polygon([Vector3(*x) for x in points]), 1 / 16)
+				patch = shape.polys[self.random.randrange(len(shape.polys))]
+				origin = (patch.center.x, patch.center.y, patch.center.z - 0.5)
+				brightness = self.random.uniform(50, 400)
+				self.add_light(origin, (brightness, brightness * 0.9, brightness * 0.8), (0.0, 0.0, -1.0), EmitType.emit_surface, texinfo, cluster)
+			else:
+				origin = (self.random.uniform(0, 4096), self.random.uniform(0, 4096), 256.0)
+				self.add_light(origin, (100.0, 100.0, 100.0), (0.0, 0.0, -1.0), EmitType.emit_point, 0)
+
+		return self
+
+	def lumps(self):
+		return {
+			BSPLumps.LUMP_PLANES: (b"".join(self.planes), 0),
+			BSPLumps.LUMP_TEXDATA: (b"".join(self.texdatas), 0),
+			BSPLumps.LUMP_VERTEXES: (b"".join(self.verts), 0),
+			BSPLumps.LUMP_TEXINFO: (b"".join(self.texinfos), 0),
+			BSPLumps.LUMP_FACES: (b"".join(self.faces), 1),
+			BSPLumps.LUMP_LEAFS: (b"".join(self.leafs), 1),
+			BSPLumps.LUMP_LEAFFACES: (struct.pack(f"{len(self.leaffaces)}H", *self.leaffaces), 0),
+			BSPLumps.LUMP_EDGES: (b"".join(struct.pack("2H", *x) for x in self.edges), 0),
+			BSPLumps.LUMP_SURFEDGES: (struct.pack(f"{len(self.surfedges)}i", *self.surfedges), 0),
+			BSPLumps.LUMP_WORLDLIGHTS: (b"".join(self.lights), 1 if self.version >= 21 else 0),
+			BSPLumps.LUMP_BRUSHES: (struct.pack("3I", 0, 0, 1), 0),
+			BSPLumps.LUMP_BRUSHSIDES: (struct.pack("H2h2b", 0, 0, -1, 0, 0), 0),
+			BSPLumps.LUMP_TEXDATA_STRING_DATA: (bytes(self.strings), 0),
+			BSPLumps.LUMP_TEXDATA_STRING_TABLE: (struct.pack(f"{len(self.stringtable)}i", *self.stringtable), 0),
+			BSPLumps.LUMP_WORLDLIGHTS_HDR: (b"".join(self.hdr_lights) if self.hdr else b"", 1 if self.version >= 21 else 0),
+		}
+
+	@staticmethod
+	def compress(data):
+		""" Same LZMA compressed lump the engine tools write, uncompressed size goes to lump fourCC """
+		lc, lp, pb, dict_size = 3, 0, 2, 1 << 16
+		compressed = lzma.compress(data, lzma.FORMAT_RAW, filters = [{"id": lzma.FILTER_LZMA1, "dict_size": dict_size, "lc": lc, "lp": lp, "pb": pb}])
+		properties = struct.pack("<BI", (pb * 5 + lp) * 9 + lc, dict_size)
+		return struct.pack("<4sII5s", b"LZMA", len(data), len(compressed), properties) + compressed, struct.unpack("4b", struct.pack("<i", len(data)))
+
+	def tobytes(self, map_revision = 1, compressed = False):
+		header = bytearray(struct.pack("2I", 0x50534256, self.version))
+		body = bytearray()
+		offset = 1036
+
+		lumps = self.lumps()
+		for i in range(BSPLumps.HEADER_LUMPS):
+			data, version = lumps.get(BSPLumps(i), (b"", 0))
+			fourcc = (0, 0, 0, 0)
+			if compressed and data:
+				data, fourcc = self.compress(data)
+			header.extend(struct.pack("3I4b", offset + len(body) if data else 0, len(data), version, *fourcc))
+			body.extend(data)
+			body.extend(b"\x00" * (-len(body) % 4))
+
+		header.extend(struct.pack("I", map_revision))
+
+		# BSPFile reads map revision from the last 4 bytes of the file
+		return bytes(header + body + struct.pack("I", map_revision))
+
+	def save(self, path, map_revision = 1, compressed = False):
+		with open(path, "wb") as out:
+			out.write(self.tobytes(map_revision, compressed))
+
+
+if __name__ == "__main__":
+	parser = ArgumentParser(description = 'Generates a synthetic Source 1 Engine map for benchmarking.', formatter_class = ArgumentDefaultsHelpFormatter)
+	parser.add_argument('--bsp_version', type = int, choices = (20, 21), default = 21)
+	parser.add_argument('--faces', type = int, default = 1000)
+	parser.add_argument('--light_faces', type = int, default = 100)
+	parser.add_argument('--worldlights', type = int, default = 150)
+	parser.add_argument('--textures', type = int, default = 16)
+	parser.add_argument('--vertices', type = int, default = 0)
+	parser.add_argument('--strings', type = int, default = 0)
+	parser.add_argument('--big_panels', type = int, default = 0)
+	parser.add_argument('--degenerate', type = int, default = 0)
+	parser.add_argument('--seed', type = int, default = 0)
+	parser.add_argument('--hdr', action = 'store_true', default = False)
+	parser.add_argument('--lzma', action = 'store_true', default = False)
+	parser.add_argument('output')
+	args = parser.parse_args()
+
+	SyntheticBSP(args.bsp_version, args.faces, args.light_faces, args.worldlights, args.textures, args.vertices, args.strings, big_panels = args.big_panels, seed = args.seed, hdr = args.hdr, degenerate = args.degenerate).build().save(args.output, compressed = args.lzma)
@@ -212,3 +212,113 @@ class Vector(object):
 	def w(self):
 		""" Returns the fourth vector component """
 		return self.values[3]
+
+
+class Vector3(object):
+	""" Fixed size 3D vector with slots and unrolled operations, used in the geometry hot paths """
+	__slots__ = ("x", "y", "z")
+
+	def __init__(self, x = 0, y = 0, z = 0):
+		""" Create a vector, example: v = Vector3(1,2,3) """
+		self.x = x
+		self.y = y
+		self.z = z
+
+	def length(self):
+		""" Returns the length (magnitude) of the vector """
+		return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+	def scale(self, scaleby):
+		""" Scales Vector by some value """
+		return Vector3(self.x * scaleby, self.y * scaleby, self.z * scaleby)
+
+	def extend(self, direction, scale):
+		""" Extends Vector in a direction multiplied by a scale """
+		return Vector3(self.x + direction.x * scale, self.y + direction.y * scale, self.z + direction.z * scale)
+
+	def normalize(self):
+		""" Returns a normalized unit vector """
+		length = self.length()
+		if length == 0:
+			return Vector3(0, 0, 0)
+		return Vector3(self.x / length, self.y / length, self.z / length)
+
+	def cross(self, other):
+		""" Returns the cross product of self and other vector """
+		return Vector3(
+			self.y * other.z - other.y * self.z,
+			self.z * other.x - other.z * self.x,
+			self.x * other.y - other.x * self.y
+		)
+
+	def inner(self, other):
+		""" Returns the dot product (inner product) of self and other vector """
+		return self.x * other.x + self.y * other.y + self.z * other.z
+
+	def close_enough(self, other, eps):
+		""" Same as Vector.close_enough(), components are compared by their absolute values """
+		d = abs(self.x) - abs(other.x)
+		if d < -eps or d > eps:
+			return False
+		d = abs(self.y) - abs(other.y)
+		if d < -eps or d > eps:
+			return False
+		d = abs(self.z) - abs(other.z)
+		return -eps <= d <= eps
+
+	def normalize_toscale(self):
+		return self / max(self.x, self.y, self.z)
+
+	def copy(self):
+		return Vector3(self.x, self.y, self.z)
+
+	def __mul__(self, other):
+		""" Returns the dot product with another Vector3, or the vector scaled by a number """
+		if isinstance(other, Vector3):
+			return self.x * other.x + self.y * other.y + self.z * other.z
+		elif isinstance(other, (float, int)):
+			return Vector3(self.x * other, self.y * other, self.z * other)
+		return NotImplemented
+
+	def __rmul__(self, other):
+		""" Called if 4*self for instance """
+		return self.__mul__(other)
+
+	def __truediv__(self, other):
+		if isinstance(other, (float, int)):
+			return Vector3(self.x / other, self.y / other, self.z / other)
+		return NotImplemented
+
+	def __add__(self, other):
+		""" Returns the vector addition of self and other """
+		return Vector3(self.x + other.x, self.y + other.y, self.z + other.z)
+
+	def __sub__(self, other):
+		""" Returns the vector difference of self and other """
+		return Vector3(self.x - other.x, self.y - other.y, self.z - other.z)
+
+	def __pow__(self, power, modulo=None):
+		if isinstance(power, (float, int)):
+			return Vector3(self.x ** power, self.y ** power, self.z ** power)
+		return NotImplemented
+
+	def __neg__(self):
+		return Vector3(-self.x if self.x != 0 else self.x, -self.y if self.y != 0 else self.y, -self.z if self.z != 0 else self.z)
+
+	def __iter__(self):
+		return iter((self.x, self.y, self.z))
+
+	def __len__(self):
+		return 3
+
+	def __getitem__(self, key):
+		return (self.x, self.y, self.z)[key]
+
+	def __setitem__(self, key, value):
+		setattr(self, Vector3.__slots__[key], value)
+
+	def __repr__(self):
+		return str([self.x, self.y, self.z])
+
+	def __eq__(self, other):
+		return self.x == other[0] and self.y == other[1] and self.z == other[2]
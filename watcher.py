@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import struct
+import select
+import ctypes
+import ctypes.util
+
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+inotify_event = struct.Struct("iIII")
+
+
+def signature(st):
+	return (st.st_size, st.st_mtime_ns)
+
+
+class DirectoryWatcher:
+	""" Watches a directory for new and changed maps, reporting each once it hasn't changed for settle seconds """
+
+	suffix = ".bsp"
+	mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+	def __init__(self, directory, settle = 2.0, interval = 1.0):
+		assert os.path.isdir(directory), f"{directory} is not a directory!"
+
+		self.directory = directory
+		self.settle = settle
+		self.interval = interval
+		# (size, mtime) of every map when the directory was scanned last, and of every map when it was reported,
+		# maps that are already there count as reported, see request()
+		self.seen = self.scan()
+		self.reported = dict(self.seen)
+		# Maps that have changed and aren't settled yet, path -> ((size, mtime), time it was last seen changing)
+		self.pending = dict()
+		self.fd = self.open_inotify()
+
+	@property
+	def backend(self):
+		return "polling" if self.fd is None else "inotify"
+
+	def open_inotify(self):
+		""" inotify descriptor watching the directory, None if inotify isn't available and the directory has to be polled """
+		if not sys.platform.startswith("linux"):
+			return None
+
+		try:
+			libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True)
+			init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+		except (OSError, AttributeError):
+			return None
+
+		add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+
+		fd = init(os.O_NONBLOCK | os.O_CLOEXEC)
+		if fd < 0:
+			print(f"Failed to initialize inotify ({os.strerror(ctypes.get_errno())}), polling {self.directory} instead.", file = sys.stderr)
+			return None
+
+		if add_watch(fd, os.fsencode(self.directory), self.mask) < 0:
+			print(f"Failed to watch {self.directory} with inotify ({os.strerror(ctypes.get_errno())}), polling it instead.", file = sys.stderr)
+			os.close(fd)
+			return None
+
+		return fd
+
+	def scan(self):
+		maps = dict()
+		with os.scandir(self.directory) as entries:
+			for entry in entries:
+				if entry.name.lower().endswith(self.suffix) and entry.is_file():
+					maps[entry.path] = signature(entry.stat())
+		return maps
+
+	def rescan(self):
+		""" Maps that were added or changed since the last scan """
+		current = self.scan()
+		changed = [x for x, sig in current.items() if self.seen.get(x) != sig]
+		self.seen = current
+		return changed
+
+	def read_events(self):
+		""" Maps the pending inotify events are about, or all of the changed maps if the event queue has overflown """
+		changed = []
+		overflow = False
+
+		while True:
+			try:
+				data = os.read(self.fd, 64 * 1024)
+			except BlockingIOError:
+				break
+
+			offset = 0
+			while offset < len(data):
+				wd, mask, cookie, length = inotify_event.unpack_from(data, offset)
+				name = data[offset + inotify_event.size:offset + inotify_event.size + length].rstrip(b"\x00")
+				offset = offset + inotify_event.size + length
+
+				assert not mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED), f"{self.directory} was removed or moved, it can't be watched anymore!"
+
+				if mask & IN_Q_OVERFLOW:
+					overflow = True
+				elif os.fsdecode(name).lower().endswith(self.suffix):
+					changed.append(os.path.join(self.directory, os.fsdecode(name)))
+
+		return self.rescan() if overflow else changed
+
+	def wait(self, timeout):
+		""" Waits for the changes in the directory up to timeout seconds (forever if None), returns the maps that have changed """
+		if self.fd is None:
+			time.sleep(timeout)
+			return self.rescan()
+
+		if not select.select([self.fd], [], [], timeout)[0]:
+			return []
+
+		return self.read_events()
+
+	def request(self, path):
+		""" Reports the map once it settles, even if it hasn't changed since it was reported last """
+		self.reported.pop(path, None)
+		self.pending.setdefault(path, (None, time.monotonic()))
+
+	def settled(self):
+		""" Pending maps that haven't changed for settle seconds and differ from the ones that were reported """
+		now = time.monotonic()
+		ready = []
+
+		for path, (sig, since) in list(self.pending.items()):
+			try:
+				current = signature(os.stat(path))
+			except FileNotFoundError:
+				del self.pending[path]
+				self.reported.pop(path, None)
+				continue
+
+			if current != sig:
+				self.pending[path] = (current, now)
+			elif now - since >= self.settle:
+				del self.pending[path]
+				if self.reported.get(path) != current:
+					self.reported[path] = current
+					ready.append(path)
+
+		return sorted(ready)
+
+	def __iter__(self):
+		""" Yields paths of the new and changed maps as they settle, forever """
+		while True:
+			# Pending maps are checked for settling every interval seconds, even if nothing else happens
+			timeout = self.interval if self.pending or self.fd is None else None
+			for path in self.wait(timeout):
+				self.pending.setdefault(path, (None, time.monotonic()))
+
+			yield from self.settled()
+
+	def close(self):
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()